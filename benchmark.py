@@ -0,0 +1,305 @@
+# anarchism and gender
+# benchmark.py
+
+# standard imports
+import argparse
+import importlib.util
+import json
+import locale
+import logging
+import os
+import platform
+import re
+import tempfile
+import time
+from datetime import datetime
+
+# data
+import numpy as np
+import pandas as pd
+
+# project specific
+from db import (
+    Journal,
+    Issue,
+    Page,
+    get_db_session,
+    get_journal_by_url,
+    get_page_by_url,
+)
+from synthetic import SEARCH_TERMS, generate_corpus
+from timeseries import UNITS, query_time_series
+
+# arguments
+parser = argparse.ArgumentParser()
+parser.add_argument("--verbose", help="increase output verbosity", action="store_true")
+parser.add_argument("--issues", help="synthetic issues", type=int, default=100)
+parser.add_argument("--pages", help="pages per issue", type=int, default=8)
+parser.add_argument("--words-per-page", help="words per page", type=int, default=1500)
+parser.add_argument("--repeats", help="runs per benchmark", type=int, default=3)
+parser.add_argument("--output", help="json file for the results")
+parser.add_argument("--baseline", help="json results to compare against")
+parser.add_argument(
+    "--threshold",
+    help="allowed slowdown factor before a benchmark counts as regression",
+    type=float,
+    default=1.25,
+)
+
+# logging
+FORMAT = "%(asctime)-15s %(levelname)s %(message)s"
+logging.basicConfig(
+    filename=f"log/{datetime.now()}_benchmark.log", format=FORMAT, level=20
+)
+logger = logging.getLogger("anarchism_benchmark")
+
+# create console handler and set level to debug
+ch = logging.StreamHandler()
+ch.setLevel(logging.DEBUG)
+
+# create formatter
+formatter = logging.Formatter(FORMAT)
+
+# add formatter to ch
+ch.setFormatter(formatter)
+
+# add ch to logger
+logger.addHandler(ch)
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+# what a missing optional dependency looks like, e.g. spaCy, selenium or the
+# de_AT locale; anything else is a real failure
+MISSING_DEPENDENCY_ERRORS = (ImportError, OSError, locale.Error)
+
+page_marker_pattern = re.compile(r"\[ [^\]\n]+ - \d{8} - Seite \d+ \]\n")
+
+
+def load_script(name):
+    """Import one of the project scripts without running its main block.
+
+    statistics.py would shadow the standard library module, so scripts are
+    loaded under an ``anarchism_`` prefix.
+    """
+    spec = importlib.util.spec_from_file_location(
+        f"anarchism_{name}", os.path.join(SCRIPT_DIR, f"{name}.py")
+    )
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def measure(function, repeats, setup=None):
+    """Median and minimum wall time of *function* over *repeats* runs.
+
+    *setup* runs untimed before every run, its result is passed to *function*.
+    """
+    timings = []
+    for _ in range(repeats):
+        argument = setup() if setup else None
+        start = time.perf_counter()
+        function(argument) if setup else function()
+        timings.append(time.perf_counter() - start)
+    return {
+        "median": float(np.median(timings)),
+        "min": float(np.min(timings)),
+        "repeats": repeats,
+    }
+
+
+def insert_corpus(session, corpus):
+    """Store *corpus* the way crawl.py stores crawled issues."""
+    for item in corpus:
+        journal = get_journal_by_url(session, item["journal_url"])
+        if not journal:
+            journal = Journal(item["journal_title"], item["journal_url"])
+        session.add(journal)
+        session.commit()
+
+        issue = Issue(journal.journal_id, item["issue_date"], item["url"], item["text"])
+        session.add(issue)
+        session.commit()
+
+        page_texts = page_marker_pattern.split(item["text"].decode("utf-8"))[1:]
+        for number, ((page_url, hit), page_text) in enumerate(
+            zip(item["pages"], page_texts), 1
+        ):
+            page = get_page_by_url(session, page_url)
+            if not page:
+                page = Page(issue.issue_id, number, page_text, hit, page_url)
+            session.add(page)
+        session.commit()
+
+
+def bench_get_page_text(corpus, repeats):
+    crawl = load_script("crawl")
+
+    def run():
+        for item in corpus:
+            for number in range(1, len(item["pages"]) + 1):
+                crawl.get_page_text(
+                    item["journal_title"], item["issue_date"], item["text"], number
+                )
+
+    return measure(run, repeats)
+
+
+def bench_db_inserts(corpus, repeats, directory):
+    runs = iter(range(repeats))
+
+    def setup():
+        return get_db_session(os.path.join(directory, f"insert_{next(runs)}.db"))
+
+    return measure(lambda session: insert_corpus(session, corpus), repeats, setup)
+
+
+def get_benchmark_nlp():
+    """de_core_news_lg if installed, otherwise a blank German sentencizer."""
+    import spacy
+
+    try:
+        return spacy.load("de_core_news_lg")
+    except OSError:
+        nlp = spacy.blank("de")
+        nlp.add_pipe(nlp.create_pipe("sentencizer"))
+        return nlp
+
+
+def bench_matcher(statistics, corpus, repeats, dump_file):
+    statistics.issue_query = [
+        (i, 1, item["issue_date"], item["text"]) for i, item in enumerate(corpus)
+    ]
+    return measure(
+        lambda: statistics.dump_relevant_text(
+            [term.lower() for term in SEARCH_TERMS], dump_file
+        ),
+        repeats,
+    )
+
+
+def bench_most_common_token_pos(statistics, dump_file, repeats):
+    matches = pd.read_csv(dump_file, delimiter=";")
+
+    def setup():
+        # parsed sentences are cached, start every run from scratch
+        statistics.batched_parser.cache.clear()
+        return matches
+
+    return measure(
+        lambda df: statistics.get_most_common_token_pos(df, "NOUN"), repeats, setup
+    )
+
+
+def bench_chart_aggregation(session, repeats):
+    def run():
+        for unit in UNITS[:-1]:
+            for granularity in ("day", "month"):
+                query_time_series(session, unit, granularity)
+
+    return measure(run, repeats)
+
+
+def run_benchmarks(corpus, repeats, directory):
+    results = {}
+    dump_file = os.path.join(directory, "dump.csv")
+
+    try:
+        results["get_page_text"] = bench_get_page_text(corpus, repeats)
+    except MISSING_DEPENDENCY_ERRORS as e:
+        results["get_page_text"] = {"skipped": repr(e)}
+
+    results["db_inserts"] = bench_db_inserts(corpus, repeats, directory)
+    session = get_db_session(os.path.join(directory, "insert_0.db"))
+    results["chart_aggregation"] = bench_chart_aggregation(session, repeats)
+    session.close()
+
+    try:
+        statistics = load_script("statistics")
+        statistics.nlp = get_benchmark_nlp()
+        statistics.batched_parser = statistics.BatchedParser(statistics.nlp)
+    except MISSING_DEPENDENCY_ERRORS as e:
+        statistics = None
+        reason = repr(e)
+    if statistics:
+        results["matcher"] = bench_matcher(statistics, corpus, repeats, dump_file)
+        results["matcher"]["pipeline"] = statistics.nlp.pipe_names
+        if "tagger" in statistics.nlp.pipe_names:
+            results["most_common_token_pos"] = bench_most_common_token_pos(
+                statistics, dump_file, repeats
+            )
+        else:
+            results["most_common_token_pos"] = {
+                "skipped": "de_core_news_lg is not installed"
+            }
+    else:
+        results["matcher"] = {"skipped": reason}
+        results["most_common_token_pos"] = {"skipped": reason}
+    return results
+
+
+def get_regressions(results, baseline, threshold):
+    """Names of benchmarks slower than the baseline median times *threshold*."""
+    regressions = []
+    for name, result in results["benchmarks"].items():
+        reference = baseline["benchmarks"].get(name, {})
+        if "median" not in result or "median" not in reference:
+            continue
+        limit = reference["median"] * threshold
+        if result["median"] > limit:
+            regressions.append(name)
+            logger.warning(
+                f"Regression in {name}: {result['median']:.3f}s > {limit:.3f}s"
+            )
+    return regressions
+
+
+if __name__ == "__main__":
+    t1 = datetime.now()
+    args = parser.parse_args()
+    if args.verbose:
+        logger.setLevel(10)
+
+    corpus = generate_corpus(args.issues, args.pages, args.words_per_page)
+    logger.info(
+        f"Generated {len(corpus)} issues with "
+        f"{sum(len(item['text']) for item in corpus)} bytes of text."
+    )
+    with tempfile.TemporaryDirectory() as directory:
+        benchmarks = run_benchmarks(corpus, args.repeats, directory)
+
+    results = {
+        "created": datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "scale": {
+            "issues": args.issues,
+            "pages": args.pages,
+            "words_per_page": args.words_per_page,
+        },
+        "threshold": args.threshold,
+        "benchmarks": benchmarks,
+    }
+    for name, result in benchmarks.items():
+        if "median" in result:
+            logger.info(
+                f"{name:<24} {result['median']:8.3f}s (min {result['min']:.3f}s)"
+            )
+        else:
+            logger.info(f"{name:<24} skipped: {result['skipped']}")
+
+    output = args.output or f"tmp/benchmarks/{t1.strftime('%Y%m%d%H%M%S')}.json"
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    logger.info(f"Saved results to: '{output}'")
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline, "r") as f:
+            baseline = json.load(f)
+        if baseline["scale"] != results["scale"]:
+            logger.warning("Baseline was measured on a different corpus scale.")
+        regressions = get_regressions(results, baseline, args.threshold)
+
+    logger.info(f"Completed. Processing took {(datetime.now() - t1).seconds}s.")
+    if regressions:
+        raise SystemExit(1)
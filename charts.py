@@ -3,27 +3,77 @@
 
 # standard imports
 import argparse
+import hashlib
+import itertools
+import json
 import logging
-from datetime import datetime
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
 
 # data
-import pandas as pd
 import numpy as np
 
 # plotting
 import matplotlib.pyplot as plt
 
-# db
-from sqlalchemy import create_engine, func
-from sqlalchemy.orm import sessionmaker
-
 # project specific
-from db import Base, Journal, Issue, Page
+from columnar import get_duckdb_connection
+from db import get_corpus_path, get_db_session, query_journals
+from profiling import Profiler, span, timed
+from timeseries import (
+    GRANULARITIES,
+    UNITS,
+    get_period_label,
+    get_period_start,
+    get_periods,
+    get_time_series,
+)
+from token_index import TokenIndex
 
 # arguments
 parser = argparse.ArgumentParser()
 parser.add_argument("--verbose", help="increase output verbosity", action="store_true")
 parser.add_argument("--dump-db", help="don't run chrome headless", action="store_true")
+parser.add_argument("--unit", help="what to count", choices=UNITS, default="issues")
+parser.add_argument(
+    "--granularity",
+    help="period covered by one bar",
+    choices=GRANULARITIES,
+    default="month",
+)
+parser.add_argument(
+    "--journal", help="only count this journal id", type=int, action="append"
+)
+parser.add_argument(
+    "--per-journal", help="draw one bar per journal and period", action="store_true"
+)
+parser.add_argument(
+    "--term", help="search term counted by --unit matches", default="Anarchis*"
+)
+parser.add_argument(
+    "--date-from", help="first issue date (YYYY-MM-DD)", type=datetime.fromisoformat
+)
+parser.add_argument(
+    "--date-to", help="issue date to stop at (YYYY-MM-DD)", type=datetime.fromisoformat
+)
+parser.add_argument(
+    "--duckdb", help="aggregate from the duckdb export", action="store_true"
+)
+parser.add_argument(
+    "--batch", help="render all charts of a json spec file without showing them"
+)
+parser.add_argument(
+    "--workers",
+    help="number of processes for --batch",
+    type=int,
+    default=os.cpu_count(),
+)
+parser.add_argument(
+    "--profile",
+    help="write cpu profiles and log timings of the hot functions",
+    action="store_true",
+)
 
 # logging
 FORMAT = "%(asctime)-15s %(levelname)s %(message)s"
@@ -51,19 +101,15 @@ SEARCH_TEXT = "Anarchis*"
 DATE_FROM = "01.01.1898"
 DATE_TO = "31.12.1898"
 
-
-def get_db_session(echo=False):
-    engine = create_engine(
-        f"sqlite:///{SEARCH_TEXT.replace('*','')}_{DATE_FROM}-{DATE_TO}.db",
-        encoding="utf-8",
-        echo=echo,
-    )
-    Base.metadata.create_all(engine)
-    Session = sessionmaker(bind=engine)
-    return Session()
+UNIT_LABELS = {
+    "issues": "Zeitungsausgaben",
+    "pages": "Seiten",
+    "hits": "Seiten mit Treffern",
+    "matches": "Treffer",
+}
 
 
-def autolabel(rects):
+def autolabel(ax, rects):
     """Attach a text label above each bar in *rects*, displaying its height."""
     for rect in rects:
         height = rect.get_height()
@@ -77,70 +123,258 @@ def autolabel(rects):
         )
 
 
-if __name__ == "__main__":
-    t1 = datetime.now()
-    args = parser.parse_args()
-    if args.verbose:
-        logger.setLevel(10)
-    session = get_db_session(args.verbose)
-    # issue stats
-    issue_query = session.query(
-        Issue.issue_id, Issue.journal_id, Issue.issue_date, Issue.text
-    )
-    issue_stats = [(i[0], i[1], i[2], i[3]) for i in issue_query]
-    issue_df = pd.DataFrame(
-        issue_stats,
-        columns=["id", "journal_id", "date", "text"],
-    )
+@timed()
+def plot_time_series(
+    series,
+    unit,
+    granularity,
+    title,
+    journal_titles=None,
+    date_from=None,
+    date_to=None,
+):
+    """Bar chart of a time series, one bar group per period.
 
+    Without *journal_titles* the counts of all journals are summed up,
+    otherwise every journal gets its own bar. Periods without counts between
+    *date_from* and *date_to* (or the first and last period) get empty bars.
     """
-    plt.figure()
-    ax = (issue_df["date"].groupby(issue_df["date"].dt.month).count().plot(
-        kind="bar"))
-    ax.bar()
-    ax.set_facecolor('#eeeeee')
-    ax.set_xlabel("1898")
-    ax.set_ylabel("Zeitungsausgaben")
-    ax.set_title(f"Begriff: {SEARCH_TEXT}")
-    ax.set_xticks(x)
-    ax.set_xticklabels(issue_df["date"].groupby(issue_df["date"].dt.month).count())
-    plt.show()
-    """
-    labels = [
-        "Jänner",
-        "Februar",
-        "März",
-        "April",
-        "Mai",
-        "Juni",
-        "Juli",
-        "August",
-        "September",
-        "Oktober",
-        "November",
-        "Dezember",
-    ]
-    men_means = issue_df["date"].groupby(issue_df["date"].dt.month).count()
+    counts = series.pivot_table(
+        index="period",
+        columns="journal_id",
+        values="count",
+        aggfunc="sum",
+        fill_value=0,
+    ).sort_index()
+    starts = [get_period_start(p, granularity) for p in counts.index]
+    first_day = date_from or (min(starts) if starts else None)
+    last_day = date_to - timedelta(days=1) if date_to else max(starts, default=None)
+    if first_day and last_day:
+        counts = counts.reindex(
+            get_periods(granularity, first_day, last_day), fill_value=0
+        )
+    if journal_titles is None:
+        counts = counts.sum(axis=1).to_frame(UNIT_LABELS[unit])
+    else:
+        counts.columns = [journal_titles.get(j, str(j)) for j in counts.columns]
+    years = sorted({period[:4] for period in counts.index})
+    labels = [get_period_label(p, granularity, len(years) > 1) for p in counts.index]
 
     x = np.arange(len(labels))  # the label locations
-    width = 0.35  # the width of the bars
+    width = 0.8 / max(len(counts.columns), 1)  # the width of the bars
 
     fig, ax = plt.subplots()
-    rects = ax.bar(x - width / 2, men_means, width, label="Zeitungsausgaben")
+    for i, column in enumerate(counts.columns):
+        rects = ax.bar(x - 0.4 + width * (i + 0.5), counts[column], width, label=column)
+        if len(counts.columns) == 1:
+            autolabel(ax, rects)
 
     # Add some text for labels, title and custom x-axis tick labels, etc.
     ax.set_ylabel("Anzahl")
-    ax.set_title(f"Begriff: {SEARCH_TEXT}")
-    ax.set_xlabel("1898")
+    ax.set_title(title)
+    ax.set_xlabel(", ".join(years))
     ax.set_xticks(x)
-    ax.set_xticklabels(labels)
+    ax.set_xticklabels(labels, rotation=45)
     ax.legend()
 
-    autolabel(rects)
-
     fig.tight_layout()
-    plt.xticks(rotation=45)
-    plt.show()
+    return fig
+
+
+def get_batch_jobs(session, spec, index=None, connection=None):
+    """Aggregate the series of every chart in *spec* and describe its output.
+
+    The spec lists ``journals`` (a journal id, a list of ids or null for all
+    journals), ``terms`` and ``granularities``; every combination becomes one
+    chart of ``unit`` saved in all ``formats`` to ``output_dir``.
+    """
+    unit = spec.get("unit", "issues")
+    terms = spec.get("terms", [SEARCH_TEXT]) if unit == "matches" else [SEARCH_TEXT]
+    date_from = spec.get("date_from")
+    date_from = datetime.fromisoformat(date_from) if date_from else None
+    date_to = spec.get("date_to")
+    date_to = datetime.fromisoformat(date_to) if date_to else None
+    journal_titles = {j[0]: j[1] for j in query_journals(session)}
+    jobs = []
+    for journals, term, granularity in itertools.product(
+        spec.get("journals", [None]),
+        terms,
+        spec.get("granularities", ["month"]),
+    ):
+        journal_ids = [journals] if isinstance(journals, int) else journals
+        series = get_time_series(
+            session,
+            unit,
+            granularity,
+            journal_ids,
+            date_from,
+            date_to,
+            term,
+            index,
+            connection,
+        )
+        journal_part = "-".join(map(str, journal_ids)) if journal_ids else "all"
+        term_part = term.replace("*", "").lower()
+        title = f"Begriff: {term}"
+        if journal_ids:
+            title += (
+                f" in {', '.join(journal_titles.get(j, str(j)) for j in journal_ids)}"
+            )
+        jobs.append(
+            {
+                "name": f"{unit}_{term_part}_{journal_part}_{granularity}",
+                "series": series,
+                "unit": unit,
+                "granularity": granularity,
+                "title": title,
+                "journal_titles": journal_titles if spec.get("per_journal") else None,
+                "date_from": date_from,
+                "date_to": date_to,
+            }
+        )
+    return jobs
+
+
+def render_chart(job, output_dir, formats):
+    plt.switch_backend("Agg")
+    fig = plot_time_series(
+        job["series"],
+        job["unit"],
+        job["granularity"],
+        job["title"],
+        job["journal_titles"],
+        job["date_from"],
+        job["date_to"],
+    )
+    for file_format in formats:
+        fig.savefig(os.path.join(output_dir, f"{job['name']}.{file_format}"))
+    plt.close(fig)
+    return job["name"]
+
+
+def get_job_digest(job, formats):
+    digest = hashlib.sha1(job["series"].to_csv(index=False).encode("utf-8"))
+    digest.update(
+        json.dumps(
+            [
+                job["title"],
+                job["granularity"],
+                job["journal_titles"],
+                str(job["date_from"]),
+                str(job["date_to"]),
+                formats,
+            ]
+        ).encode("utf-8")
+    )
+    return digest.hexdigest()
+
+
+def export_charts(session, spec, index=None, connection=None, workers=None):
+    """Render every chart of *spec* in a process pool, skipping unchanged ones.
+
+    A manifest in the output directory remembers a digest of the aggregated
+    series and the chart settings of every rendered chart.
+    """
+    output_dir = spec.get("output_dir", "charts")
+    formats = spec.get("formats", ["png"])
+    os.makedirs(output_dir, exist_ok=True)
+    manifest_file = os.path.join(output_dir, "manifest.json")
+    manifest = {}
+    if os.path.exists(manifest_file):
+        with open(manifest_file, "r") as f:
+            manifest = json.load(f)
+
+    pending = []
+    for job in get_batch_jobs(session, spec, index, connection):
+        digest = get_job_digest(job, formats)
+        outputs = [
+            os.path.join(output_dir, f"{job['name']}.{file_format}")
+            for file_format in formats
+        ]
+        if manifest.get(job["name"]) == digest and all(map(os.path.exists, outputs)):
+            logger.debug(f"Skipping unchanged chart: {job['name']}")
+            continue
+        manifest[job["name"]] = digest
+        pending.append(job)
+
+    # the workers are not profiled, their time shows up as one span
+    with span("render_chart"), ProcessPoolExecutor(max_workers=workers) as executor:
+        for name in executor.map(
+            render_chart,
+            pending,
+            itertools.repeat(output_dir),
+            itertools.repeat(formats),
+        ):
+            logger.debug(f"Rendered chart: {name}")
+    with open(manifest_file, "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    logger.info(f"Rendered {len(pending)} charts to: '{output_dir}'")
+
+
+if __name__ == "__main__":
+    t1 = datetime.now()
+    args = parser.parse_args()
+    if args.verbose:
+        logger.setLevel(10)
+    profiler = None
+    if args.profile:
+        profiler = Profiler("charts")
+        profiler.start()
+    try:
+        session = get_db_session(
+            get_corpus_path(SEARCH_TEXT, DATE_FROM, DATE_TO), args.verbose
+        )
+
+        index_path = get_corpus_path(SEARCH_TEXT, DATE_FROM, DATE_TO, "tokens")
+        connection = None
+        if args.duckdb:
+            connection = get_duckdb_connection(
+                get_corpus_path(SEARCH_TEXT, DATE_FROM, DATE_TO, "duckdb")
+            )
+
+        if args.batch:
+            with open(args.batch, "r") as f:
+                spec = json.load(f)
+            index = None
+            if spec.get("unit") == "matches":
+                index = TokenIndex.load(index_path)
+            plt.switch_backend("Agg")
+            export_charts(session, spec, index, connection, args.workers)
+        else:
+            index = None
+            if args.unit == "matches":
+                index = TokenIndex.load(index_path)
+            series = get_time_series(
+                session,
+                args.unit,
+                args.granularity,
+                args.journal,
+                args.date_from,
+                args.date_to,
+                args.term,
+                index,
+                connection,
+            )
+            journal_titles = None
+            if args.per_journal:
+                journal_titles = {j[0]: j[1] for j in query_journals(session)}
+
+            fig = plot_time_series(
+                series,
+                args.unit,
+                args.granularity,
+                f"Begriff: {args.term if args.unit == 'matches' else SEARCH_TEXT}",
+                journal_titles,
+                args.date_from,
+                args.date_to,
+            )
+            # keep the time the chart window is open out of the profile
+            if profiler:
+                profiler.stop()
+            plt.show()
 
-    session.close()
+        session.close()
+    finally:
+        if profiler:
+            profiler.stop()
     logger.info(f"Completed. Processing took {(datetime.now() - t1).seconds}s.")
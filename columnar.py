@@ -0,0 +1,281 @@
+# anarchism and gender
+# columnar.py
+
+# standard imports
+import json
+import logging
+import os
+import shutil
+from collections import defaultdict
+from datetime import datetime
+
+# data
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# project specific
+from db import Issue, Page, query_journals
+
+logger = logging.getLogger("anarchism")
+
+CHUNK_SIZE = 500  # rows read from the db at once
+ROWS_PER_GROUP = 1000  # rows buffered per partition before they are written
+PARTITION_COLUMNS = ["journal_id", "year"]
+TABLES = ("journals", "issues", "pages", "matches")
+
+ISSUE_SCHEMA = pa.schema(
+    [
+        ("issue_id", pa.int64()),
+        ("journal_id", pa.int64()),
+        ("issue_date", pa.timestamp("ns")),
+        ("url", pa.string()),
+        ("text", pa.string()),
+        ("text_length", pa.int64()),
+        ("year", pa.int64()),
+    ]
+)
+PAGE_SCHEMA = pa.schema(
+    [
+        ("page_id", pa.int64()),
+        ("issue_id", pa.int64()),
+        ("number", pa.int64()),
+        ("hit", pa.bool_()),
+        ("url", pa.string()),
+        ("text", pa.string()),
+        ("journal_id", pa.int64()),
+        ("issue_date", pa.timestamp("ns")),
+        ("text_length", pa.int64()),
+        ("year", pa.int64()),
+    ]
+)
+
+
+def write_partitioned(chunks, path, basename, schema):
+    """Write DataFrame *chunks* as one Parquet file per partition.
+
+    Rows are buffered per partition and written in row groups of
+    ROWS_PER_GROUP, so many small chunks don't turn into many small files.
+    """
+    file_schema = pa.schema(
+        [field for field in schema if field.name not in PARTITION_COLUMNS]
+    )
+    writers = {}
+    buffers = defaultdict(list)
+    buffered = defaultdict(int)
+
+    def flush(key):
+        rows = pd.concat(buffers.pop(key)).drop(columns=PARTITION_COLUMNS)
+        buffered.pop(key)
+        if key not in writers:
+            directory = os.path.join(
+                path, *(f"{c}={v}" for c, v in zip(PARTITION_COLUMNS, key))
+            )
+            os.makedirs(directory, exist_ok=True)
+            writers[key] = pq.ParquetWriter(
+                os.path.join(directory, f"{basename}-0.parquet"), file_schema
+            )
+        writers[key].write_table(
+            pa.Table.from_pandas(rows, schema=file_schema, preserve_index=False)
+        )
+
+    for chunk in chunks:
+        for key, rows in chunk.groupby(PARTITION_COLUMNS):
+            buffers[key].append(rows)
+            buffered[key] += len(rows)
+            if buffered[key] >= ROWS_PER_GROUP:
+                flush(key)
+    for key in list(buffers):
+        flush(key)
+    for writer in writers.values():
+        writer.close()
+
+
+def get_issue_chunks(session, after_issue_id=0, chunk_size=CHUNK_SIZE):
+    """Issues with an id above *after_issue_id* as DataFrames of *chunk_size*."""
+    while True:
+        rows = (
+            session.query(
+                Issue.issue_id,
+                Issue.journal_id,
+                Issue.issue_date,
+                Issue.url,
+                Issue.text,
+            )
+            .filter(Issue.issue_id > after_issue_id)
+            .order_by(Issue.issue_id)
+            .limit(chunk_size)
+            .all()
+        )
+        if not rows:
+            return
+        issues = pd.DataFrame(
+            rows, columns=["issue_id", "journal_id", "issue_date", "url", "text"]
+        )
+        issues["text"] = [t.decode("utf-8", errors="replace") for t in issues["text"]]
+        issues["text_length"] = issues["text"].str.len()
+        issues["year"] = issues["issue_date"].dt.year
+        yield issues
+        after_issue_id = rows[-1][0]
+
+
+def get_page_chunks(session, after_page_id=0, chunk_size=CHUNK_SIZE):
+    """Pages with an id above *after_page_id*, with journal id and issue date."""
+    while True:
+        rows = (
+            session.query(
+                Page.page_id,
+                Page.issue_id,
+                Page.number,
+                Page.hit,
+                Page.url,
+                Page.text,
+                Issue.journal_id,
+                Issue.issue_date,
+            )
+            .join(Issue, Page.issue_id == Issue.issue_id)
+            .filter(Page.page_id > after_page_id)
+            .order_by(Page.page_id)
+            .limit(chunk_size)
+            .all()
+        )
+        if not rows:
+            return
+        pages = pd.DataFrame(
+            rows,
+            columns=[
+                "page_id",
+                "issue_id",
+                "number",
+                "hit",
+                "url",
+                "text",
+                "journal_id",
+                "issue_date",
+            ],
+        )
+        pages["text_length"] = pages["text"].str.len().fillna(0).astype(int)
+        pages["year"] = pages["issue_date"].dt.year
+        yield pages
+        after_page_id = rows[-1][0]
+
+
+def export_corpus(session, path, sync=False, dump_file=None):
+    """Write journals, issues, pages and match dumps to partitioned Parquet.
+
+    Issues, pages and matches are partitioned by journal id and year. With
+    *sync* only issues and pages added since the last export are appended,
+    rows changed in the db afterwards (``crawl.py --update``) need a full
+    export. Returns the export manifest.
+    """
+    manifest_file = os.path.join(path, "export.json")
+    manifest = {"last_issue_id": 0, "last_page_id": 0, "dump_version": None}
+    if sync and os.path.exists(manifest_file):
+        with open(manifest_file, "r") as f:
+            manifest = json.load(f)
+    elif os.path.exists(path):
+        for table in TABLES:
+            shutil.rmtree(os.path.join(path, table), ignore_errors=True)
+    os.makedirs(path, exist_ok=True)
+    run = datetime.now().strftime("%Y%m%d%H%M%S%f")
+
+    journals = pd.DataFrame(
+        [tuple(j) for j in query_journals(session)],
+        columns=["journal_id", "title", "language", "publication_place"],
+    )
+    os.makedirs(os.path.join(path, "journals"), exist_ok=True)
+    journals.to_parquet(os.path.join(path, "journals", "journals.parquet"))
+
+    def track(chunks, key, column):
+        # remember the last exported id while the chunks pass to the writer
+        for chunk in chunks:
+            manifest[key] = int(chunk[column].max())
+            logger.debug(f"Exported {column} up to {manifest[key]}.")
+            yield chunk
+
+    write_partitioned(
+        track(
+            get_issue_chunks(session, manifest["last_issue_id"]),
+            "last_issue_id",
+            "issue_id",
+        ),
+        os.path.join(path, "issues"),
+        run,
+        ISSUE_SCHEMA,
+    )
+    write_partitioned(
+        track(
+            get_page_chunks(session, manifest["last_page_id"]),
+            "last_page_id",
+            "page_id",
+        ),
+        os.path.join(path, "pages"),
+        run,
+        PAGE_SCHEMA,
+    )
+
+    if dump_file and os.path.exists(dump_file):
+        dump_version = os.stat(dump_file).st_mtime_ns
+        if dump_version != manifest["dump_version"]:
+            matches = pd.read_csv(
+                dump_file, delimiter=";", index_col=0, parse_dates=["issue_date"]
+            )
+            matches["sentence"] = matches["sentence"].astype(str)
+            matches["year"] = matches["issue_date"].dt.year
+            shutil.rmtree(os.path.join(path, "matches"), ignore_errors=True)
+            write_partitioned(
+                [matches],
+                os.path.join(path, "matches"),
+                run,
+                pa.Schema.from_pandas(matches, preserve_index=False),
+            )
+            manifest["dump_version"] = dump_version
+
+    manifest["exported_at"] = run
+    with open(manifest_file, "w") as f:
+        json.dump(manifest, f, indent=2)
+    logger.info(f"Exported corpus to: '{path}'")
+    return manifest
+
+
+def create_duckdb(duckdb_path, path, manifest):
+    """Create or refresh a DuckDB database with views on the Parquet export."""
+    import duckdb
+
+    connection = duckdb.connect(duckdb_path)
+    path = os.path.abspath(path)
+    connection.execute(
+        "CREATE OR REPLACE VIEW journals AS SELECT * FROM read_parquet("
+        f"'{os.path.join(path, 'journals', '*.parquet')}')"
+    )
+    for table in TABLES[1:]:
+        if not os.path.exists(os.path.join(path, table)):
+            continue
+        connection.execute(
+            f"CREATE OR REPLACE VIEW {table} AS SELECT * FROM read_parquet("
+            f"'{os.path.join(path, table, '**', '*.parquet')}', hive_partitioning=true)"
+        )
+    connection.execute(
+        "CREATE OR REPLACE TABLE export_info AS "
+        "SELECT ? AS exported_at, ? AS export_path",
+        [manifest["exported_at"], path],
+    )
+    connection.close()
+    logger.info(f"Created DuckDB views in: '{duckdb_path}'")
+
+
+def get_duckdb_connection(duckdb_path):
+    import duckdb
+
+    return duckdb.connect(duckdb_path, read_only=True)
+
+
+def get_export_version(connection):
+    """Last export run of the Parquet files behind a DuckDB *connection*.
+
+    Read from the manifest, as ``export.py --sync`` without ``--duckdb``
+    appends files the views pick up without touching the DuckDB file.
+    """
+    path = connection.execute("SELECT export_path FROM export_info").fetchone()[0]
+    with open(os.path.join(path, "export.json"), "r") as f:
+        return json.load(f)["exported_at"]
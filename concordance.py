@@ -0,0 +1,164 @@
+# anarchism and gender
+# concordance.py
+
+# standard imports
+import argparse
+import logging
+from datetime import datetime
+
+# data
+import numpy as np
+import pandas as pd
+
+# project specific
+from db import get_corpus_path, get_db_session
+from token_index import TokenIndex, build_token_index
+
+# arguments
+parser = argparse.ArgumentParser()
+parser.add_argument("--verbose", help="increase output verbosity", action="store_true")
+parser.add_argument(
+    "--build", help="build the token index from the db", action="store_true"
+)
+parser.add_argument(
+    "--normalise-ocr",
+    help="index ocr normalised texts instead of raw texts",
+    action="store_true",
+)
+parser.add_argument(
+    "term", help="search term, a trailing * matches prefixes", nargs="?"
+)
+parser.add_argument("--left", help="left context in tokens", type=int, default=10)
+parser.add_argument("--right", help="right context in tokens", type=int, default=10)
+parser.add_argument(
+    "--journal", help="only show matches of this journal id", type=int, action="append"
+)
+parser.add_argument(
+    "--date-from", help="first issue date (YYYY-MM-DD)", type=datetime.fromisoformat
+)
+parser.add_argument(
+    "--date-to", help="issue date to stop at (YYYY-MM-DD)", type=datetime.fromisoformat
+)
+parser.add_argument(
+    "--sort", help="sort order of the lines", choices=["date", "left", "right"]
+)
+parser.add_argument("--limit", help="maximum number of lines", type=int)
+
+# logging
+FORMAT = "%(asctime)-15s %(levelname)s %(message)s"
+logging.basicConfig(
+    filename=f"log/{datetime.now()}_concordance.log", format=FORMAT, level=20
+)
+logger = logging.getLogger("anarchism")
+
+# create console handler and set level to debug
+ch = logging.StreamHandler()
+ch.setLevel(logging.DEBUG)
+
+# create formatter
+formatter = logging.Formatter(FORMAT)
+
+# add formatter to ch
+ch.setFormatter(formatter)
+
+# add ch to logger
+logger.addHandler(ch)
+
+# search parameters
+JOURNAL_TYPE = "journal"
+SEARCH_TEXT = "Anarchis*"
+DATE_FROM = "01.01.1898"
+DATE_TO = "31.12.1898"
+
+
+def get_concordance(
+    index,
+    term,
+    left=10,
+    right=10,
+    journal_ids=None,
+    date_from=None,
+    date_to=None,
+    sort=None,
+):
+    """Keyword in context lines for *term* as a DataFrame.
+
+    *sort* is ``left`` (by the words preceding the match, nearest first),
+    ``right`` (by the words following it) or ``None`` (corpus order, i.e.
+    by issue).
+    """
+    hits = index.get_hits(term)
+    issues = np.searchsorted(index.issue_indptr, hits, side="right") - 1
+    mask = np.ones(len(hits), dtype=bool)
+    if journal_ids:
+        mask &= np.isin(index.journal_ids[issues], journal_ids)
+    if date_from is not None:
+        mask &= index.issue_dates[issues] >= np.datetime64(date_from)
+    if date_to is not None:
+        mask &= index.issue_dates[issues] < np.datetime64(date_to)
+    hits = hits[mask]
+    issues = issues[mask]
+    # context never crosses issue boundaries
+    left_starts = np.maximum(hits - left, index.issue_indptr[issues])
+    right_ends = np.minimum(hits + right, index.issue_indptr[issues + 1] - 1)
+
+    lines = pd.DataFrame(
+        {
+            "issue_id": index.issue_ids[issues],
+            "journal_id": index.journal_ids[issues],
+            "issue_date": index.issue_dates[issues],
+            "left": [index.get_text(s, h - 1) for s, h in zip(left_starts, hits)],
+            "match": [index.get_text(h, h) for h in hits],
+            "right": [index.get_text(h + 1, e) for h, e in zip(hits, right_ends)],
+        }
+    )
+    if sort == "left":
+        sort_keys = lines["left"].str.lower().str.split().str[::-1].str.join(" ")
+        lines = lines.iloc[np.argsort(sort_keys.values, kind="stable")]
+    elif sort == "right":
+        lines = lines.iloc[np.argsort(lines["right"].str.lower().values, kind="stable")]
+    elif sort == "date":
+        lines = lines.sort_values("issue_date", kind="stable")
+    logger.debug(f"Found {len(lines)} lines for: '{term}'")
+    return lines
+
+
+def print_concordance(index, lines, width=60):
+    for line in lines.itertuples():
+        journal_title = index.journal_titles.get(line.journal_id, line.journal_id)
+        print(
+            f"{str(line.issue_date)[:10]} {str(journal_title)[:24]:<24} "
+            f"{line.left[-width:]:>{width}} {line.match} {line.right[:width]}"
+        )
+
+
+if __name__ == "__main__":
+    t1 = datetime.now()
+    args = parser.parse_args()
+    if args.verbose:
+        logger.setLevel(10)
+    index_path = get_corpus_path(SEARCH_TEXT, DATE_FROM, DATE_TO, "tokens")
+
+    if args.build:
+        session = get_db_session(
+            get_corpus_path(SEARCH_TEXT, DATE_FROM, DATE_TO), args.verbose
+        )
+        build_token_index(session, index_path, args.normalise_ocr)
+        session.close()
+
+    if args.term:
+        index = TokenIndex.load(index_path)
+        lines = get_concordance(
+            index,
+            args.term,
+            args.left,
+            args.right,
+            args.journal,
+            args.date_from,
+            args.date_to,
+            args.sort,
+        )
+        if args.limit:
+            lines = lines.head(args.limit)
+        print_concordance(index, lines)
+    logger.info(f"Completed. Processing took {(datetime.now() - t1).seconds}s.")
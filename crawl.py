@@ -15,9 +15,17 @@ from selenium.webdriver.chrome.options import Options
 from selenium.common.exceptions import NoSuchElementException
 
 # db
-from sqlalchemy import create_engine, func
-from sqlalchemy.orm import sessionmaker
-from db import Base, Journal, Issue, Page
+from db import (
+    Journal,
+    Issue,
+    Page,
+    get_corpus_path,
+    get_db_session,
+    get_issue_by_url,
+    get_journal_by_url,
+    get_page_by_url,
+)
+from profiling import Profiler, span, timed
 
 # set german locale for accurate datetime parsing
 locale.setlocale(locale.LC_TIME, "de_AT")
@@ -39,6 +47,11 @@ parser.add_argument(
     help="skip issue crawling if issue is already in db",
     action="store_true",
 )
+parser.add_argument(
+    "--profile",
+    help="write cpu profiles and log timings of the hot functions",
+    action="store_true",
+)
 # TODO: add search args text, date
 
 
@@ -91,17 +104,6 @@ def setup_webdriver(run_headless=True):
     )
 
 
-def get_db_session(echo=False):
-    engine = create_engine(
-        f"sqlite:///{SEARCH_TEXT.replace('*','')}_{DATE_FROM}-{DATE_TO}.db",
-        encoding="utf-8",
-        echo=echo,
-    )
-    Base.metadata.create_all(engine)
-    Session = sessionmaker(bind=engine)
-    return Session()
-
-
 def get_url_param_string(
     search_text, date_from, date_to, page=1, journal_type="journal"
 ):
@@ -142,6 +144,7 @@ def get_issue_links():
     return issue_list
 
 
+@timed()
 def get_issue_text(issue_abbr, issue_date):
     r = requests.get(
         "https://anno.onb.ac.at/cgi-content/annoshow",
@@ -151,6 +154,7 @@ def get_issue_text(issue_abbr, issue_date):
     return r.content
 
 
+@timed()
 def get_page_text(journal_title, issue_date, issue_text, page):
     start_tag = f"[ {journal_title} - {datetime.strftime(issue_date, '%Y%m%d')} - Seite {page} ]"
     end_tag = f"[ {journal_title} - {datetime.strftime(issue_date, '%Y%m%d')} - Seite {page + 1} ]"
@@ -176,109 +180,125 @@ if __name__ == "__main__":
 
     if args.verbose:
         logger.setLevel(10)
-
-    session = get_db_session(args.verbose)
-    logger.info("Established database connection.")
-    driver = setup_webdriver(args.no_headless)
-    logger.info("Setup webdriver.")
-
-    issue_list_filename = (
-        f"issues/{SEARCH_TEXT.replace('*','')}_{DATE_FROM}-{DATE_TO}.txt"
-    )
-
-    if not args.skip_issue_crawling:
-        issue_list = get_issue_links()
-        # save links to file
-        with open(issue_list_filename, "w") as f:
-            f.write("\n".join(issue_list))
-        logger.info(f"Saved issue list to: '{issue_list_filename}'")
-    else:
-        with open(issue_list_filename, "r") as f:
-            issue_list = f.readlines()
-        logger.info(
-            f"Read issue list from: '{issue_list_filename}' with {len(issue_list)} items."
+    profiler = None
+    if args.profile:
+        profiler = Profiler("crawl")
+        profiler.start()
+    try:
+
+        session = get_db_session(
+            get_corpus_path(SEARCH_TEXT, DATE_FROM, DATE_TO), args.verbose
         )
+        logger.info("Established database connection.")
+        driver = setup_webdriver(args.no_headless)
+        logger.info("Setup webdriver.")
 
-    for issue_url in issue_list:
-        issue_url = issue_url.strip()
-        issue = session.query(Issue).filter(Issue.url == issue_url).first()
-        if args.skip_db_issues:
-            logger.debug(f"Checking if issue with url: {issue_url} is in db.")
-            if issue:
-                logger.debug(f"Skipping issue with urL: {issue_url}. Is already in db.")
-                continue
-        driver.get(issue_url)
-        logger.debug(f"Crawling issue from: {issue_url}")
-        # journal info
-        journal_title = driver.find_element_by_css_selector(
-            "div#tools-media h2.title"
-        ).text
-        journal_url = driver.find_element_by_css_selector(
-            "div#tools-media-page div.content span.xoom a[title='info']"
-        ).get_attribute("href")
-        journal_url = f"{journal_url}"
-        journal_abbr = issue_url.split("/ANNO/")[1][0:3]
-
-        journal = session.query(Journal).filter(Journal.url == journal_url).first()
-        if journal:
-            if args.update:
-                journal.title = journal_title
-                # TODO: update further journal data
-        else:
-            journal = Journal(journal_title, journal_url)
-        logger.debug(
-            f"Journal info extracted. Title: {journal_title} with abbreviation: {journal_abbr}."
-        )
-        session.add(journal)
-        session.commit()
-
-        # issue info
-        issue_date = driver.find_element_by_css_selector(
-            "div#tools-main div.content ul li:nth-child(3)"
-        ).text.strip()
-        issue_date = datetime.strptime(
-            issue_date.replace("Januar", "Jänner"), "%d. %B %Y"
-        )
-        issue_text = get_issue_text(journal_abbr, issue_date)
-        logger.debug(
-            f"Issue info extracted. Issue date: {issue_date} and issue text: {issue_text[:10]}"
+        issue_list_filename = (
+            f"issues/{SEARCH_TEXT.replace('*','')}_{DATE_FROM}-{DATE_TO}.txt"
         )
 
-        if issue:
-            if args.update:
-                issue.text = issue_text
+        if not args.skip_issue_crawling:
+            issue_list = get_issue_links()
+            # save links to file
+            with open(issue_list_filename, "w") as f:
+                f.write("\n".join(issue_list))
+            logger.info(f"Saved issue list to: '{issue_list_filename}'")
         else:
-            issue = Issue(journal.journal_id, issue_date, issue_url, issue_text)
-        session.add(issue)
-        session.commit()
-
-        # page info
-        page_number = 1
-        for page_link in driver.find_elements_by_css_selector(
-            "div#content div.prevws a"
-        ):
-            page_url = page_link.get_attribute("href")
-            page = session.query(Page).filter(Page.url == page_url).first()
-            page_text = get_page_text(
-                journal_title, issue_date, issue_text, page_number
+            with open(issue_list_filename, "r") as f:
+                issue_list = f.readlines()
+            logger.info(
+                f"Read issue list from: '{issue_list_filename}' with {len(issue_list)} items."
             )
-            try:
-                page_link.find_element_by_class_name("treffer")
-                hit = True
-            except NoSuchElementException:
-                hit = False
-            if page:
+
+        for issue_url in issue_list:
+            issue_url = issue_url.strip()
+            issue = get_issue_by_url(session, issue_url)
+            if args.skip_db_issues:
+                logger.debug(f"Checking if issue with url: {issue_url} is in db.")
+                if issue:
+                    logger.debug(
+                        f"Skipping issue with urL: {issue_url}. Is already in db."
+                    )
+                    continue
+            with span("webdriver"):
+                driver.get(issue_url)
+            logger.debug(f"Crawling issue from: {issue_url}")
+            # journal info
+            journal_title = driver.find_element_by_css_selector(
+                "div#tools-media h2.title"
+            ).text
+            journal_url = driver.find_element_by_css_selector(
+                "div#tools-media-page div.content span.xoom a[title='info']"
+            ).get_attribute("href")
+            journal_url = f"{journal_url}"
+            journal_abbr = issue_url.split("/ANNO/")[1][0:3]
+
+            journal = get_journal_by_url(session, journal_url)
+            if journal:
                 if args.update:
-                    page.text = page_text
+                    journal.title = journal_title
+                    # TODO: update further journal data
             else:
-                page = Page(issue.issue_id, page_number, page_text, hit, page_url)
-            session.add(page)
+                journal = Journal(journal_title, journal_url)
             logger.debug(
-                f"Page info extracted. Number: {page_number}, page url: {page_url} and page text: {page_text[:10] if page_text else None}"
+                f"Journal info extracted. Title: {journal_title} with abbreviation: {journal_abbr}."
+            )
+            session.add(journal)
+            with span("db commit"):
+                session.commit()
+
+            # issue info
+            issue_date = driver.find_element_by_css_selector(
+                "div#tools-main div.content ul li:nth-child(3)"
+            ).text.strip()
+            issue_date = datetime.strptime(
+                issue_date.replace("Januar", "Jänner"), "%d. %B %Y"
+            )
+            issue_text = get_issue_text(journal_abbr, issue_date)
+            logger.debug(
+                f"Issue info extracted. Issue date: {issue_date} and issue text: {issue_text[:10]}"
             )
-            page_number += 1
-        session.commit()
 
-    session.close()
-    driver.quit()
+            if issue:
+                if args.update:
+                    issue.text = issue_text
+            else:
+                issue = Issue(journal.journal_id, issue_date, issue_url, issue_text)
+            session.add(issue)
+            with span("db commit"):
+                session.commit()
+
+            # page info
+            page_number = 1
+            for page_link in driver.find_elements_by_css_selector(
+                "div#content div.prevws a"
+            ):
+                page_url = page_link.get_attribute("href")
+                page = get_page_by_url(session, page_url)
+                page_text = get_page_text(
+                    journal_title, issue_date, issue_text, page_number
+                )
+                try:
+                    page_link.find_element_by_class_name("treffer")
+                    hit = True
+                except NoSuchElementException:
+                    hit = False
+                if page:
+                    if args.update:
+                        page.text = page_text
+                else:
+                    page = Page(issue.issue_id, page_number, page_text, hit, page_url)
+                session.add(page)
+                logger.debug(
+                    f"Page info extracted. Number: {page_number}, page url: {page_url} and page text: {page_text[:10] if page_text else None}"
+                )
+                page_number += 1
+            with span("db commit"):
+                session.commit()
+
+        session.close()
+        driver.quit()
+    finally:
+        if profiler:
+            profiler.stop()
     logger.info(f"Completed. Processing took {(datetime.now() - t1).seconds}s.")
@@ -1,15 +1,34 @@
+# standard imports
+from functools import lru_cache
+
 from sqlalchemy import (
+    bindparam,
+    create_engine,
+    event,
+    func,
+    inspect,
     Column,
     Boolean,
     Integer,
     String,
     DateTime,
     Text,
+    LargeBinary,
     ForeignKey,
 )
+from sqlalchemy.ext import baked
 from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import sessionmaker
 
 Base = declarative_base()
+bakery = baked.bakery()
+
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "cache_size": -64000,  # KiB
+    "mmap_size": 268435456,  # bytes
+}
 
 
 class Journal(Base):
@@ -35,8 +54,10 @@ class Issue(Base):
     __tablename__ = "issues"
 
     issue_id = Column(Integer, primary_key=True)
-    journal_id = Column(Integer, ForeignKey(Journal.journal_id), nullable=False)
-    issue_date = Column(DateTime, nullable=False)
+    journal_id = Column(
+        Integer, ForeignKey(Journal.journal_id), nullable=False, index=True
+    )
+    issue_date = Column(DateTime, nullable=False, index=True)
     url = Column(String(512), unique=True)
     text = Column(Text, nullable=False)
 
@@ -54,7 +75,7 @@ class Page(Base):
     __tablename__ = "pages"
 
     page_id = Column(Integer, primary_key=True)
-    issue_id = Column(Integer, ForeignKey(Issue.issue_id), nullable=False)
+    issue_id = Column(Integer, ForeignKey(Issue.issue_id), nullable=False, index=True)
     number = Column(Integer, nullable=False)
     text = Column(Text, nullable=True)
     hit = Column(Boolean, default=False, nullable=False)
@@ -69,3 +90,141 @@ class Page(Base):
 
     def __repr__(self):
         return f"<Page {self.page_id}>"
+
+
+class NormalisedText(Base):
+    __tablename__ = "normalised_texts"
+
+    issue_id = Column(Integer, ForeignKey(Issue.issue_id), primary_key=True)
+    version = Column(Integer, nullable=False)
+    text = Column(Text, nullable=False)
+    offsets = Column(LargeBinary, nullable=False)
+
+    def __init__(self, issue_id, version, text, offsets):
+        self.issue_id = issue_id
+        self.version = version
+        self.text = text
+        self.offsets = offsets
+
+    def __repr__(self):
+        return f"<NormalisedText {self.issue_id}>"
+
+
+def get_corpus_path(search_text, date_from, date_to, extension="db"):
+    return f"{search_text.replace('*','')}_{date_from}-{date_to}.{extension}"
+
+
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for name, value in SQLITE_PRAGMAS.items():
+        cursor.execute(f"PRAGMA {name}={value}")
+    cursor.close()
+
+
+@lru_cache(maxsize=None)
+def get_engine(filename, echo=False):
+    """Engine for the sqlite db *filename*, created once per process.
+
+    Every connection gets the SQLITE_PRAGMAS, missing tables and indexes
+    (e.g. of dbs created before the indexes existed) are added.
+    """
+    engine = create_engine(f"sqlite:///{filename}", encoding="utf-8", echo=echo)
+    event.listen(engine, "connect", set_sqlite_pragmas)
+    Base.metadata.create_all(engine)
+    inspector = inspect(engine)
+    for table in Base.metadata.sorted_tables:
+        existing = {index["name"] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(engine)
+    return engine
+
+
+def get_db_session(filename, echo=False):
+    Session = sessionmaker(bind=get_engine(filename, echo))
+    return Session()
+
+
+def get_journal_by_url(session, url):
+    query = bakery(lambda session: session.query(Journal))
+    query += lambda q: q.filter(Journal.url == bindparam("url"))
+    return query(session).params(url=url).first()
+
+
+def get_issue_by_url(session, url):
+    query = bakery(lambda session: session.query(Issue))
+    query += lambda q: q.filter(Issue.url == bindparam("url"))
+    return query(session).params(url=url).first()
+
+
+def get_page_by_url(session, url):
+    query = bakery(lambda session: session.query(Page))
+    query += lambda q: q.filter(Page.url == bindparam("url"))
+    return query(session).params(url=url).first()
+
+
+def query_journals(session):
+    query = bakery(
+        lambda session: session.query(
+            Journal.journal_id,
+            Journal.title,
+            Journal.language,
+            Journal.publication_place,
+        )
+    )
+    return query(session)
+
+
+def query_issues(
+    session,
+    journal_ids=None,
+    date_from=None,
+    date_to=None,
+    text=True,
+    yield_per=None,
+):
+    """(issue_id, journal_id, issue_date[, text]) rows ordered by issue id.
+
+    Journal and date filters are answered by the indexes on issues. With
+    *yield_per* rows are fetched in chunks of that size instead of all at once.
+    """
+    if text:
+        query = bakery(
+            lambda session: session.query(
+                Issue.issue_id, Issue.journal_id, Issue.issue_date, Issue.text
+            )
+        )
+    else:
+        query = bakery(
+            lambda session: session.query(
+                Issue.issue_id, Issue.journal_id, Issue.issue_date
+            )
+        )
+    params = {}
+    if journal_ids:
+        query += lambda q: q.filter(
+            Issue.journal_id.in_(bindparam("journal_ids", expanding=True))
+        )
+        params["journal_ids"] = list(journal_ids)
+    if date_from is not None:
+        query += lambda q: q.filter(Issue.issue_date >= bindparam("date_from"))
+        params["date_from"] = date_from
+    if date_to is not None:
+        query += lambda q: q.filter(Issue.issue_date < bindparam("date_to"))
+        params["date_to"] = date_to
+    query += lambda q: q.order_by(Issue.issue_id)
+    result = query(session).params(**params)
+    if yield_per:
+        result = result.with_post_criteria(lambda q: q.yield_per(yield_per))
+    return result
+
+
+def query_text_size(session):
+    """Summed and largest issue text size in bytes."""
+    query = bakery(
+        lambda session: session.query(
+            func.coalesce(func.sum(func.length(Issue.text)), 0),
+            func.coalesce(func.max(func.length(Issue.text)), 0),
+        )
+    )
+    return query(session).one()
@@ -0,0 +1,124 @@
+# anarchism and gender
+# dedup.py
+
+# standard imports
+import logging
+import re
+import zlib
+from collections import defaultdict
+
+# data
+import numpy as np
+
+logger = logging.getLogger("anarchism")
+
+SHINGLE_SIZE = 5  # words
+NUM_PERM = 128
+BANDS = 32
+MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+MAX_HASH = np.uint64((1 << 32) - 1)
+
+word_pattern = re.compile(r"\w+")
+
+
+def get_shingles(text, size=SHINGLE_SIZE):
+    """Hash every run of *size* consecutive lower-cased words of *text*."""
+    words = word_pattern.findall(text.lower())
+    shingles = {
+        zlib.crc32(" ".join(words[i : i + size]).encode("utf-8"))
+        for i in range(max(len(words) - size + 1, 1))
+    }
+    return np.fromiter(shingles, dtype=np.uint64, count=len(shingles))
+
+
+class MinHasher:
+    def __init__(self, num_perm=NUM_PERM, seed=1):
+        generator = np.random.RandomState(seed)
+        self.a = generator.randint(1, MERSENNE_PRIME, num_perm, dtype=np.uint64)
+        self.b = generator.randint(0, MERSENNE_PRIME, num_perm, dtype=np.uint64)
+        self.num_perm = num_perm
+
+    def signature(self, shingles):
+        if not len(shingles):
+            return np.full(self.num_perm, MAX_HASH, dtype=np.uint64)
+        hashes = (np.outer(shingles, self.a) + self.b) % MERSENNE_PRIME & MAX_HASH
+        return hashes.min(axis=0)
+
+
+def find_root(parents, i):
+    while parents[i] != i:
+        parents[i] = parents[parents[i]]
+        i = parents[i]
+    return i
+
+
+def get_duplicate_clusters(
+    texts,
+    dates,
+    groups=None,
+    threshold=0.8,
+    max_days=7,
+    num_perm=NUM_PERM,
+    bands=BANDS,
+):
+    """Group near-duplicate *texts* published within *max_days* of each other.
+
+    Candidates come from a MinHash LSH index (``bands`` bands over
+    ``num_perm`` permutations), so only texts sharing a bucket are compared
+    instead of all pairs. A candidate joins a cluster if its estimated Jaccard
+    similarity reaches *threshold*. A cluster never holds two texts with the
+    same *groups* value (e.g. overlapping windows of one issue).
+
+    Returns an array holding, for every text, the index of its cluster
+    representative, which is the earliest text of the cluster.
+    """
+    hasher = MinHasher(num_perm)
+    rows = num_perm // bands
+    dates = np.array(dates, dtype="datetime64[D]")
+    order = np.argsort(dates, kind="stable")
+    rank = np.empty(len(texts), dtype=np.int64)
+    rank[order] = np.arange(len(texts))
+    signatures = np.empty((len(texts), num_perm), dtype=np.uint64)
+    for i, text in enumerate(texts):
+        signatures[i] = hasher.signature(get_shingles(text))
+
+    parents = np.arange(len(texts))
+    # groups of the texts in every cluster, by cluster root
+    cluster_groups = None
+    if groups is not None:
+        cluster_groups = {i: {group} for i, group in enumerate(groups)}
+    buckets = defaultdict(list)
+    compared = 0
+    for i in order:
+        candidates = set()
+        for band in range(bands):
+            key = (band, signatures[i, band * rows : (band + 1) * rows].tobytes())
+            candidates.update(buckets[key])
+            buckets[key].append(i)
+        for j in candidates:
+            if groups is not None and groups[i] == groups[j]:
+                continue
+            if dates[i] - dates[j] > np.timedelta64(max_days, "D"):
+                continue
+            compared += 1
+            if np.mean(signatures[i] == signatures[j]) >= threshold:
+                root_i = find_root(parents, i)
+                root_j = find_root(parents, j)
+                if root_i == root_j:
+                    continue
+                if cluster_groups is not None:
+                    if cluster_groups[root_i] & cluster_groups[root_j]:
+                        continue
+                # keep the earlier text as representative
+                if rank[root_i] > rank[root_j]:
+                    root_i, root_j = root_j, root_i
+                parents[root_j] = root_i
+                if cluster_groups is not None:
+                    cluster_groups[root_i] |= cluster_groups.pop(root_j)
+
+    clusters = np.array([find_root(parents, i) for i in range(len(texts))])
+    logger.info(
+        f"Found {len(np.unique(clusters))} clusters in {len(texts)} texts "
+        f"({compared} candidate comparisons)."
+    )
+    return clusters
@@ -0,0 +1,195 @@
+# anarchism and gender
+# dtm.py
+
+# standard imports
+import logging
+import os
+from collections import Counter
+
+# data
+import numpy as np
+from scipy import sparse
+
+# project specific
+from profiling import timed
+
+logger = logging.getLogger("anarchism")
+
+ENTITY_KIND = "ENT"
+MATRIX_ARRAYS = ("data", "indices", "indptr")
+ROW_ARRAYS = ("issue_ids", "journal_ids", "issue_dates")
+
+
+def get_doc_terms(doc):
+    """Return normalised (term, kind) pairs for the tokens and entities of *doc*.
+
+    Tokens are keyed by their part of speech, entities by ``ENTITY_KIND``.
+    Numbers, punctuation and whitespace are never counted, so they are left out.
+    """
+    terms = [
+        (token.text.lower(), token.pos_)
+        for token in doc
+        if not (token.like_num or token.is_punct or token.is_space)
+    ]
+    terms += [(" ".join(ent.text.lower().split()), ENTITY_KIND) for ent in doc.ents]
+    return terms
+
+
+class DocumentTermMatrix:
+    """Sparse term counts with one row per document (issue, sentence or window).
+
+    Rows carry issue id, journal id and issue date, columns a normalised term
+    and its kind (POS tag or ``ENTITY_KIND``). On disk every array is a plain
+    ``.npy`` file, so the matrix can be memory-mapped instead of read.
+    """
+
+    def __init__(self, matrix, vocabulary, kinds, issue_ids, journal_ids, issue_dates):
+        self.matrix = matrix
+        self.vocabulary = vocabulary
+        self.kinds = kinds
+        self.issue_ids = issue_ids
+        self.journal_ids = journal_ids
+        self.issue_dates = issue_dates
+
+    def __repr__(self):
+        return f"<DocumentTermMatrix {self.matrix.shape[0]}x{self.matrix.shape[1]}>"
+
+    def save(self, path):
+        os.makedirs(path, exist_ok=True)
+        for name in MATRIX_ARRAYS:
+            np.save(os.path.join(path, f"{name}.npy"), getattr(self.matrix, name))
+        for name in ROW_ARRAYS:
+            np.save(os.path.join(path, f"{name}.npy"), getattr(self, name))
+        with open(os.path.join(path, "vocabulary.tsv"), "w") as f:
+            f.write(
+                "\n".join(
+                    f"{term}\t{kind}" for term, kind in zip(self.vocabulary, self.kinds)
+                )
+            )
+        logger.info(f"Saved {self} to: '{path}'")
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        mmap_mode = "r" if mmap else None
+        arrays = {
+            name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode=mmap_mode)
+            for name in MATRIX_ARRAYS + ROW_ARRAYS
+        }
+        with open(os.path.join(path, "vocabulary.tsv"), "r") as f:
+            vocabulary, kinds = [], []
+            for line in f.read().split("\n"):
+                if line:
+                    term, kind = line.rsplit("\t", 1)
+                    vocabulary.append(term)
+                    kinds.append(kind)
+        matrix = sparse.csr_matrix(
+            (arrays["data"], arrays["indices"], arrays["indptr"]),
+            shape=(len(arrays["indptr"]) - 1, len(vocabulary)),
+            copy=False,
+        )
+        dtm = cls(
+            matrix,
+            np.array(vocabulary, dtype=object),
+            np.array(kinds, dtype=object),
+            arrays["issue_ids"],
+            arrays["journal_ids"],
+            arrays["issue_dates"],
+        )
+        logger.debug(f"Loaded {dtm} from: '{path}'")
+        return dtm
+
+    def rows(self, journal_ids=None, date_from=None, date_to=None):
+        """Boolean row mask for *journal_ids* and the [date_from, date_to) range."""
+        mask = np.ones(self.matrix.shape[0], dtype=bool)
+        if journal_ids is not None:
+            mask &= np.isin(self.journal_ids, journal_ids)
+        if date_from is not None:
+            mask &= self.issue_dates >= np.datetime64(date_from)
+        if date_to is not None:
+            mask &= self.issue_dates < np.datetime64(date_to)
+        return mask
+
+    def columns(self, kind=None, exclude=None, exclude_prefix=None):
+        """Boolean column mask for one term kind without excluded terms."""
+        mask = np.ones(self.matrix.shape[1], dtype=bool)
+        if kind is not None:
+            mask &= self.kinds == kind
+        if exclude:
+            mask &= ~np.isin(self.vocabulary, list(exclude))
+        if exclude_prefix:
+            mask &= ~np.char.startswith(self.vocabulary.astype(str), exclude_prefix)
+        return mask
+
+    def term_frequencies(self, rows=None):
+        """Summed term counts over the selected rows (all rows if *rows* is None)."""
+        if rows is None:
+            return np.asarray(self.matrix.sum(axis=0)).ravel()
+        return np.asarray(rows.astype(self.matrix.dtype) @ self.matrix).ravel()
+
+    @timed("counter")
+    def most_common(self, rows=None, columns=None, counter_limit=20):
+        """Like ``Counter.most_common`` for the selected rows and columns."""
+        frequencies = self.term_frequencies(rows)
+        if columns is not None:
+            frequencies = np.where(columns, frequencies, 0)
+        top = np.argsort(-frequencies, kind="stable")[:counter_limit]
+        return [
+            (self.vocabulary[i], int(frequencies[i])) for i in top if frequencies[i] > 0
+        ]
+
+
+def build_document_term_matrix(nlp, documents, batch_size=50):
+    """Parse the texts of *documents* once and count their terms into a matrix.
+
+    *documents* is an iterable of ``(issue_id, journal_id, issue_date, text)``.
+    Repeated texts, like the members of a near-duplicate cluster, are parsed
+    once and their term counts copied to every row.
+    """
+    term_ids = {}
+    indptr = [0]
+    indices = []
+    data = []
+    issue_ids = []
+    journal_ids = []
+    issue_dates = []
+
+    documents = list(documents)
+    texts = list(dict.fromkeys(text for _, _, _, text in documents))
+    text_counts = {}
+    for text, doc in zip(texts, nlp.pipe(texts, batch_size=batch_size)):
+        counts = Counter(
+            term_ids.setdefault(term, len(term_ids)) for term in get_doc_terms(doc)
+        )
+        text_counts[text] = sorted(counts.items())
+    for issue_id, journal_id, issue_date, text in documents:
+        for term_id, count in text_counts[text]:
+            indices.append(term_id)
+            data.append(count)
+        indptr.append(len(indices))
+        issue_ids.append(issue_id)
+        journal_ids.append(journal_id)
+        issue_dates.append(np.datetime64(issue_date, "D"))
+
+    matrix = sparse.csr_matrix(
+        (
+            np.array(data, dtype=np.int32),
+            np.array(indices, dtype=np.int32),
+            np.array(indptr, dtype=np.int64),
+        ),
+        shape=(len(issue_ids), len(term_ids)),
+    )
+    vocabulary = np.empty(len(term_ids), dtype=object)
+    kinds = np.empty(len(term_ids), dtype=object)
+    for (term, kind), term_id in term_ids.items():
+        vocabulary[term_id] = term
+        kinds[term_id] = kind
+    dtm = DocumentTermMatrix(
+        matrix,
+        vocabulary,
+        kinds,
+        np.array(issue_ids, dtype=np.int64),
+        np.array(journal_ids, dtype=np.int64),
+        np.array(issue_dates, dtype="datetime64[D]"),
+    )
+    logger.info(f"Built {dtm} from {len(issue_ids)} documents, {len(texts)} parsed.")
+    return dtm
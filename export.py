@@ -0,0 +1,76 @@
+# anarchism and gender
+# export.py
+
+# standard imports
+import argparse
+import logging
+from datetime import datetime
+
+# project specific
+from columnar import create_duckdb, export_corpus
+from db import get_corpus_path, get_db_session
+
+# arguments
+parser = argparse.ArgumentParser()
+parser.add_argument("--verbose", help="increase output verbosity", action="store_true")
+parser.add_argument(
+    "--sync",
+    help="only append issues and pages added since the last export",
+    action="store_true",
+)
+parser.add_argument(
+    "--duckdb", help="create or refresh a duckdb database", action="store_true"
+)
+
+# logging
+FORMAT = "%(asctime)-15s %(levelname)s %(message)s"
+logging.basicConfig(
+    filename=f"log/{datetime.now()}_export.log", format=FORMAT, level=20
+)
+logger = logging.getLogger("anarchism")
+
+# create console handler and set level to debug
+ch = logging.StreamHandler()
+ch.setLevel(logging.DEBUG)
+
+# create formatter
+formatter = logging.Formatter(FORMAT)
+
+# add formatter to ch
+ch.setFormatter(formatter)
+
+# add ch to logger
+logger.addHandler(ch)
+
+# search parameters
+JOURNAL_TYPE = "journal"
+SEARCH_TEXT = "Anarchis*"
+DATE_FROM = "01.01.1898"
+DATE_TO = "31.12.1898"
+
+
+if __name__ == "__main__":
+    t1 = datetime.now()
+    args = parser.parse_args()
+    if args.verbose:
+        logger.setLevel(10)
+    session = get_db_session(
+        get_corpus_path(SEARCH_TEXT, DATE_FROM, DATE_TO), args.verbose
+    )
+
+    export_path = get_corpus_path(SEARCH_TEXT, DATE_FROM, DATE_TO, "parquet")
+    manifest = export_corpus(
+        session,
+        export_path,
+        args.sync,
+        f"tmp/{get_corpus_path(SEARCH_TEXT, DATE_FROM, DATE_TO, 'csv')}",
+    )
+    if args.duckdb:
+        create_duckdb(
+            get_corpus_path(SEARCH_TEXT, DATE_FROM, DATE_TO, "duckdb"),
+            export_path,
+            manifest,
+        )
+
+    session.close()
+    logger.info(f"Completed. Processing took {(datetime.now() - t1).seconds}s.")
@@ -0,0 +1,99 @@
+# anarchism and gender
+# keyness.py
+
+# standard imports
+import logging
+
+# data
+import numpy as np
+import pandas as pd
+from scipy.special import xlogy
+from scipy.stats import chi2
+
+logger = logging.getLogger("anarchism")
+
+CORRECTIONS = ("bonferroni", "holm", "fdr_bh")
+
+
+def adjust_p_values(p_values, correction):
+    """Correct *p_values* for multiple testing (bonferroni, holm or fdr_bh)."""
+    m = len(p_values)
+    if m == 0:
+        return p_values
+    if correction == "bonferroni":
+        return np.minimum(p_values * m, 1.0)
+    order = np.argsort(p_values, kind="stable")
+    ranked = p_values[order]
+    if correction == "holm":
+        adjusted = np.maximum.accumulate(ranked * (m - np.arange(m)))
+    elif correction == "fdr_bh":
+        adjusted = ranked * m / np.arange(1, m + 1)
+        adjusted = np.minimum.accumulate(adjusted[::-1])[::-1]
+    else:
+        raise ValueError(f"Unknown correction: '{correction}'")
+    result = np.empty(m)
+    result[order] = np.minimum(adjusted, 1.0)
+    return result
+
+
+def get_keyness(vocabulary, first, second, correction=None):
+    """Compare two term frequency vectors over the same vocabulary in one pass.
+
+    Returns a DataFrame with log-likelihood (G2), chi-squared, log ratio
+    (binary log of the relative frequency ratio, +0.5 smoothed) and the
+    p-value of every term that occurs at least once. Positive log likelihood
+    means the term is overrepresented in *first*, negative in *second*.
+    """
+    a = np.asarray(first, dtype=np.float64)
+    b = np.asarray(second, dtype=np.float64)
+    occurs = (a + b) > 0
+    vocabulary = np.asarray(vocabulary)[occurs]
+    a = a[occurs]
+    b = b[occurs]
+    c = a.sum()
+    d = b.sum()
+    n = c + d
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        expected_a = c * (a + b) / n
+        expected_b = d * (a + b) / n
+        log_likelihood = 2 * (xlogy(a, a / expected_a) + xlogy(b, b / expected_b))
+        chi_squared = (
+            n * (a * (d - b) - b * (c - a)) ** 2 / ((a + b) * (n - a - b) * c * d)
+        )
+    log_likelihood = np.nan_to_num(log_likelihood)
+    chi_squared = np.nan_to_num(chi_squared)
+    log_ratio = np.log2(((a + 0.5) / (c + 0.5)) / ((b + 0.5) / (d + 0.5)))
+    direction = np.where(a / max(c, 1) >= b / max(d, 1), 1, -1)
+    p_values = chi2.sf(log_likelihood, 1)
+
+    keyness = pd.DataFrame(
+        {
+            "term": vocabulary,
+            "first": a.astype(np.int64),
+            "second": b.astype(np.int64),
+            "log_likelihood": direction * log_likelihood,
+            "chi_squared": chi_squared,
+            "log_ratio": log_ratio,
+            "p_value": p_values,
+        }
+    )
+    if correction:
+        keyness["p_value"] = adjust_p_values(p_values, correction)
+    logger.debug(f"Computed keyness for {len(keyness)} terms ({c:.0f}/{d:.0f}).")
+    return keyness
+
+
+def get_key_terms(keyness, counter_limit=20, alpha=0.05):
+    """Most over-represented terms per side as ``(term, log likelihood)`` lists."""
+    significant = keyness[keyness["p_value"] < alpha]
+    first = significant[significant["log_likelihood"] > 0].nlargest(
+        counter_limit, "log_likelihood"
+    )
+    second = significant[significant["log_likelihood"] < 0].nsmallest(
+        counter_limit, "log_likelihood"
+    )
+    return (
+        [(t, round(ll, 2)) for t, ll in zip(first["term"], first["log_likelihood"])],
+        [(t, round(-ll, 2)) for t, ll in zip(second["term"], second["log_likelihood"])],
+    )
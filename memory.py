@@ -0,0 +1,157 @@
+# anarchism and gender
+# memory.py
+
+# standard imports
+import logging
+import os
+import sys
+import threading
+import time
+import tracemalloc
+
+logger = logging.getLogger("anarchism")
+
+SAMPLE_INTERVAL = 0.1  # seconds
+SIZE_UNITS = {"K": 1024, "M": 1024**2, "G": 1024**3, "T": 1024**4}
+
+# rough costs for the footprint estimate: raw issue texts are held by the
+# fetched query rows, the issue DataFrame and as decoded strings, a parsed
+# spaCy doc takes a few dozen bytes per character of its text, a cached
+# ParsedText of a sentence a few kilobytes
+TEXT_COPIES = 3
+DOC_BYTES_PER_CHAR = 40
+PARSED_TEXT_BYTES = 4096
+
+
+def parse_size(size):
+    """Bytes of a size like ``512M`` or ``2G`` (binary units)."""
+    size = size.strip().upper().rstrip("B")
+    if size and size[-1] in SIZE_UNITS:
+        return int(float(size[:-1]) * SIZE_UNITS[size[-1]])
+    return int(size)
+
+
+def format_size(size):
+    for unit in ("", "K", "M", "G"):
+        if abs(size) < 1024:
+            break
+        size /= 1024
+    return f"{size:.1f}{unit}" if unit else f"{size:.0f}"
+
+
+def get_rss():
+    """Resident set size of this process in bytes.
+
+    Outside of Linux only the peak resident set size is available.
+    """
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        import resource
+
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return rss if sys.platform == "darwin" else rss * 1024
+
+
+def estimate_footprint(text_size, max_text_size, model_size, cache_size=0):
+    """Estimated peak memory of an analysis run over issue texts.
+
+    *text_size* is the summed and *max_text_size* the largest issue text
+    size in bytes, *model_size* the size of the nlp model and *cache_size*
+    the number of parsed texts the BatchedParser keeps.
+    """
+    return (
+        get_rss()
+        + model_size
+        + TEXT_COPIES * text_size
+        + DOC_BYTES_PER_CHAR * max_text_size
+        + PARSED_TEXT_BYTES * cache_size
+    )
+
+
+class MemoryMonitor:
+    """Peak memory of the stages of a run, from tracemalloc and RSS sampling.
+
+    ``stage`` ends the current stage and starts the next one, ``stop`` ends
+    the last one and logs a table of all stages. tracemalloc only counts
+    python allocations (not numpy or spaCy internals) and slows allocation
+    heavy code down, so it is optional. A disabled monitor does nothing.
+    """
+
+    def __init__(self, enabled=True, trace=False, budget=None):
+        self.enabled = enabled
+        self.trace = enabled and trace
+        self.budget = budget
+        self.stages = []
+        self.name = None
+        self.rss_peak = 0
+        self.over_budget = False
+        self.running = threading.Event()
+        self.sampler = threading.Thread(target=self.sample, daemon=True)
+
+    def sample(self):
+        while self.running.is_set():
+            rss = get_rss()
+            self.rss_peak = max(self.rss_peak, rss)
+            if self.budget and rss > self.budget and not self.over_budget:
+                logger.warning(
+                    f"Memory use of {format_size(rss)} exceeds the budget "
+                    f"of {format_size(self.budget)} in stage: {self.name}"
+                )
+                self.over_budget = True
+            time.sleep(SAMPLE_INTERVAL)
+
+    def stage(self, name):
+        if not self.enabled:
+            return
+        if self.name:
+            self.end_stage()
+        elif self.trace:
+            tracemalloc.start()
+        if not self.sampler.is_alive():
+            self.running.set()
+            self.sampler.start()
+        self.name = name
+        self.started = time.perf_counter()
+        self.rss_peak = get_rss()
+        if self.trace and hasattr(tracemalloc, "reset_peak"):
+            tracemalloc.reset_peak()
+
+    def end_stage(self):
+        rss = get_rss()
+        # before python 3.9 the traced peak is the peak since the first stage
+        traced_peak = tracemalloc.get_traced_memory()[1] if self.trace else None
+        self.stages.append(
+            (
+                self.name,
+                time.perf_counter() - self.started,
+                max(self.rss_peak, rss),
+                rss,
+                traced_peak,
+            )
+        )
+
+    def stop(self):
+        if not self.enabled or not self.name:
+            return
+        self.end_stage()
+        self.running.clear()
+        self.sampler.join()
+        if self.trace:
+            tracemalloc.stop()
+        self.name = None
+        logger.info(self.get_summary())
+
+    def get_summary(self):
+        lines = [
+            f"{'stage':<24} {'time s':>8} {'peak rss':>10} {'rss after':>10} "
+            f"{'peak traced':>12}"
+        ]
+        for name, duration, rss_peak, rss, traced_peak in self.stages:
+            traced = format_size(traced_peak) if traced_peak is not None else "-"
+            lines.append(
+                f"{name[:24]:<24} {duration:>8.1f} {format_size(rss_peak):>10} "
+                f"{format_size(rss):>10} {traced:>12}"
+            )
+        return "\n".join(lines)
@@ -0,0 +1,110 @@
+# anarchism and gender
+# nlp_backend.py
+
+# standard imports
+import logging
+import math
+import os
+from collections import OrderedDict, defaultdict, namedtuple
+
+# nlp
+import spacy
+
+# project specific
+from profiling import span
+
+logger = logging.getLogger("anarchism")
+
+# the pinned spaCy 2 transformer package de_trf_bertbasecased_lg only ships
+# contextual embeddings without tagger, parser or ner heads reading them
+BACKENDS = {
+    "lg": "de_core_news_lg",
+}
+
+# only what the analyses need, so cached results don't keep docs alive
+TokenFeatures = namedtuple("TokenFeatures", ["text", "pos_", "like_num", "is_punct"])
+ParsedText = namedtuple("ParsedText", ["tokens", "ents"])
+
+CACHE_SIZE = 10000  # parsed texts
+
+
+def load_nlp(backend="lg"):
+    """Load the pipeline of *backend* for CPU inference."""
+    nlp = spacy.load(BACKENDS[backend])
+    logger.info(f"Loaded nlp backend {backend} with pipes: {nlp.pipe_names}.")
+    return nlp
+
+
+def get_model_size(backend="lg"):
+    """Size of the installed model package of *backend* in bytes.
+
+    Loaded models take roughly their size on disk in memory.
+    """
+    path = spacy.util.get_package_path(BACKENDS[backend])
+    return sum(
+        os.path.getsize(os.path.join(directory, name))
+        for directory, _, names in os.walk(path)
+        for name in names
+    )
+
+
+def get_parsed_text(doc, tokens=True):
+    ents = tuple(ent.text for ent in doc.ents)
+    if not tokens:
+        return ParsedText((), ents)
+    return ParsedText(
+        tuple(
+            TokenFeatures(token.text, token.pos_, token.like_num, token.is_punct)
+            for token in doc
+        ),
+        ents,
+    )
+
+
+class BatchedParser:
+    """Parse texts in batches of similar length and cache the results.
+
+    Texts are put into power-of-two length buckets, so a batch never pads a
+    short sentence to the length of a long window. Repeated texts are only
+    parsed once while they are among the *cache_size* most recently used.
+    """
+
+    def __init__(self, nlp, batch_size=32, cache_size=CACHE_SIZE):
+        self.nlp = nlp
+        self.batch_size = batch_size
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+
+    def store(self, key, parsed):
+        if not self.cache_size:
+            return
+        self.cache[key] = parsed
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+
+    def parse(self, texts, tokens=True):
+        """Return a ParsedText for every text in *texts*, in the same order.
+
+        Without *tokens* only the entities are kept.
+        """
+        parsed = {}
+        buckets = defaultdict(list)
+        for text in dict.fromkeys(texts):
+            key = (text, tokens)
+            if key in self.cache:
+                self.cache.move_to_end(key)
+                parsed[text] = self.cache[key]
+            else:
+                buckets[int(math.log2(len(text) + 1))].append(text)
+        for bucket in sorted(buckets):
+            bucket_texts = sorted(buckets[bucket], key=len)
+            for start in range(0, len(bucket_texts), self.batch_size):
+                batch = bucket_texts[start : start + self.batch_size]
+                with span("nlp"):
+                    for text, doc in zip(
+                        batch, self.nlp.pipe(batch, batch_size=self.batch_size)
+                    ):
+                        parsed[text] = get_parsed_text(doc, tokens)
+                        self.store((text, tokens), parsed[text])
+            logger.debug(f"Parsed {len(bucket_texts)} texts in bucket {bucket}.")
+        return [parsed[text] for text in texts]
@@ -0,0 +1,120 @@
+# anarchism and gender
+# ocr.py
+
+# standard imports
+import logging
+import re
+
+# data
+import numpy as np
+
+# project specific
+from db import NormalisedText
+
+logger = logging.getLogger("anarchism")
+
+# bump whenever the rules change, cached texts of older versions are redone
+RULES_VERSION = 2
+
+# a line broken hyphen followed by one of these ends an elliptical compound
+ELLIPSIS_CONJUNCTIONS = ("und", "oder", "bis", "sowie")
+
+word_pattern = re.compile(r"\w+")
+
+ocr_pattern = re.compile(
+    r"(?P<hyphen>(?<=\w)[-¬]\s*\n\s*(?=\w))"
+    r"|(?P<page>\s*\[ [^\]\n]+ - \d{8} - Seite \d+ \]\s*)"
+    r"|(?P<soft_hyphen>\xad)"
+    r"|(?P<long_s>ſ)"
+    r"|(?P<whitespace>\s{2,}|[\t\r\f\v])"
+)
+
+
+def get_replacement(match):
+    kind = match.lastgroup
+    if kind == "hyphen":
+        # keep the hyphen in compounds like "Arbeiter-\nZeitung" and
+        # elliptical ones like "Arbeiter-\nund Bauernpartei"
+        following = word_pattern.match(match.string, match.end()).group()
+        if following in ELLIPSIS_CONJUNCTIONS:
+            return "- "
+        return "" if following[0].islower() else "-"
+    if kind == "page":
+        return "\n"
+    if kind == "soft_hyphen":
+        return ""
+    if kind == "long_s":
+        return "s"
+    return "\n" if "\n" in match.group() else " "
+
+
+class OffsetMap:
+    """Piecewise linear map from normalised text offsets to raw text offsets.
+
+    Every replacement starts a new piece at ``(normalised, original)``.
+    """
+
+    def __init__(self, normalised_starts, original_starts):
+        self.normalised_starts = normalised_starts
+        self.original_starts = original_starts
+
+    def to_original(self, offsets):
+        offsets = np.asarray(offsets)
+        piece = np.searchsorted(self.normalised_starts, offsets, side="right") - 1
+        return self.original_starts[piece] + offsets - self.normalised_starts[piece]
+
+    def to_bytes(self):
+        return np.stack([self.normalised_starts, self.original_starts]).tobytes()
+
+    @classmethod
+    def from_bytes(cls, data):
+        starts = np.frombuffer(data, dtype=np.int64).reshape(2, -1)
+        return cls(starts[0], starts[1])
+
+
+def normalise_text(text):
+    """Apply every OCR rule to *text* in a single pass.
+
+    Returns the normalised text and an OffsetMap back to *text*.
+    """
+    pieces = []
+    normalised_starts = [0]
+    original_starts = [0]
+    position = 0
+    length = 0
+    for match in ocr_pattern.finditer(text):
+        replacement = get_replacement(match)
+        pieces.append(text[position : match.start()])
+        pieces.append(replacement)
+        length += match.start() - position + len(replacement)
+        position = match.end()
+        normalised_starts.append(length)
+        original_starts.append(position)
+    pieces.append(text[position:])
+    offset_map = OffsetMap(
+        np.array(normalised_starts, dtype=np.int64),
+        np.array(original_starts, dtype=np.int64),
+    )
+    return "".join(pieces), offset_map
+
+
+def get_normalised_text(session, issue_id, issue_text):
+    """Return the cached normalised text of an issue, normalising it if needed.
+
+    New results are added to *session*, committing is left to the caller.
+    """
+    cached = session.query(NormalisedText).get(issue_id)
+    if cached and cached.version == RULES_VERSION:
+        return cached.text, OffsetMap.from_bytes(cached.offsets)
+    text, offset_map = normalise_text(issue_text)
+    logger.debug(
+        f"Normalised issue {issue_id} from {len(issue_text)} to {len(text)} characters."
+    )
+    if cached:
+        cached.version = RULES_VERSION
+        cached.text = text
+        cached.offsets = offset_map.to_bytes()
+    else:
+        cached = NormalisedText(issue_id, RULES_VERSION, text, offset_map.to_bytes())
+    session.add(cached)
+    return text, offset_map
@@ -0,0 +1,148 @@
+# anarchism and gender
+# profiling.py
+
+# standard imports
+import cProfile
+import io
+import logging
+import os
+import pstats
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+from functools import wraps
+
+logger = logging.getLogger("anarchism")
+
+PROFILE_DIR = "tmp/profiles"
+SAMPLE_INTERVAL = 0.005  # seconds
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# span name -> [calls, total seconds, max seconds], only filled while profiling
+spans = {}
+enabled = False
+
+
+@contextmanager
+def span(name):
+    """Time the enclosed block as *name* if a Profiler is running."""
+    if not enabled:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        stats = spans.setdefault(name, [0, 0.0, 0.0])
+        stats[0] += 1
+        stats[1] += elapsed
+        stats[2] = max(stats[2], elapsed)
+
+
+def timed(name=None):
+    """Decorator recording every call of the function as a span."""
+
+    def decorator(function):
+        span_name = name or function.__qualname__
+
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            with span(span_name):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def get_stack(frame):
+    """Collapsed stack of *frame*, outermost call first."""
+    stack = []
+    while frame is not None:
+        code = frame.f_code
+        stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+        frame = frame.f_back
+    return ";".join(reversed(stack))
+
+
+class Profiler:
+    """cProfile, stack sampling and span timings for one run of a script.
+
+    ``stop`` writes ``<name>_<timestamp>.prof`` (for pstats or snakeviz),
+    ``.collapsed`` (for flamegraph.pl or speedscope) and ``.txt`` (pstats
+    restricted to the project's own files) and logs the span summary.
+    """
+
+    def __init__(self, name, directory=PROFILE_DIR, interval=SAMPLE_INTERVAL):
+        self.path = os.path.join(
+            directory, f"{name}_{datetime.now().strftime('%Y%m%d%H%M%S')}"
+        )
+        self.interval = interval
+        self.profile = cProfile.Profile()
+        self.samples = Counter()
+        self.running = threading.Event()
+        self.thread_id = threading.get_ident()
+        self.sampler = threading.Thread(target=self.sample, daemon=True)
+
+    def sample(self):
+        while self.running.is_set():
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.samples[get_stack(frame)] += 1
+            time.sleep(self.interval)
+
+    def start(self):
+        global enabled
+        spans.clear()
+        enabled = True
+        self.started = time.perf_counter()
+        self.running.set()
+        self.sampler.start()
+        self.profile.enable()
+        logger.info(f"Profiling to: '{self.path}.*'")
+
+    def stop(self):
+        """Write the profiles and log the summary, once."""
+        global enabled
+        if not self.running.is_set():
+            return
+        self.profile.disable()
+        self.running.clear()
+        self.sampler.join()
+        enabled = False
+        wall_time = time.perf_counter() - self.started
+
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.profile.dump_stats(f"{self.path}.prof")
+        with open(f"{self.path}.collapsed", "w") as f:
+            for stack, count in self.samples.most_common():
+                f.write(f"{stack} {count}\n")
+        report = io.StringIO()
+        stats = pstats.Stats(self.profile, stream=report)
+        stats.sort_stats("cumulative").print_stats(re.escape(REPO_DIR), 40)
+        with open(f"{self.path}.txt", "w") as f:
+            f.write(report.getvalue())
+
+        logger.info(self.get_summary(wall_time))
+
+    def get_summary(self, wall_time):
+        """Spans sorted by total time. Nested spans are counted inclusively."""
+        lines = [
+            f"Profile of {wall_time:.1f}s run, {sum(self.samples.values())} samples:",
+            f"{'span':<32} {'calls':>8} {'total s':>10} {'mean ms':>10} "
+            f"{'max ms':>10} {'% run':>6}",
+        ]
+        for name, (calls, total, maximum) in sorted(
+            spans.items(), key=lambda item: item[1][1], reverse=True
+        ):
+            lines.append(
+                f"{name[:32]:<32} {calls:>8} {total:>10.2f} "
+                f"{1000 * total / calls:>10.2f} {1000 * maximum:>10.2f} "
+                f"{100 * total / wall_time:>6.1f}"
+            )
+        return "\n".join(lines)
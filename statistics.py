@@ -13,21 +13,98 @@ from string import punctuation
 import numpy as np
 import pandas as pd
 
+from spacy.lang.de.stop_words import STOP_WORDS
 from spacy.matcher import Matcher
 from tqdm import tqdm
 
-# db
-from sqlalchemy import create_engine, func
-from sqlalchemy.orm import sessionmaker
-
 # project specific
-from db import Base, Journal, Issue, Page
+from columnar import get_duckdb_connection
+from db import (
+    get_corpus_path,
+    get_db_session,
+    query_issues,
+    query_journals,
+    query_text_size,
+)
+from dedup import get_duplicate_clusters
+from dtm import DocumentTermMatrix, ENTITY_KIND, build_document_term_matrix
+from keyness import CORRECTIONS, get_keyness, get_key_terms
+from memory import MemoryMonitor, estimate_footprint, format_size, parse_size
+from nlp_backend import (
+    BACKENDS,
+    CACHE_SIZE,
+    BatchedParser,
+    get_model_size,
+    load_nlp,
+)
+from ocr import get_normalised_text
+from profiling import Profiler, span, timed
 
 
 # arguments
 parser = argparse.ArgumentParser()
 parser.add_argument("--verbose", help="increase output verbosity", action="store_true")
 parser.add_argument("--dump-db", help="don't run chrome headless", action="store_true")
+parser.add_argument(
+    "--duckdb", help="read issue stats from the duckdb export", action="store_true"
+)
+parser.add_argument(
+    "--backend", help="nlp pipeline to use", choices=BACKENDS, default="lg"
+)
+parser.add_argument(
+    "--batch-size", help="number of texts per nlp batch", type=int, default=32
+)
+parser.add_argument(
+    "--two-tier",
+    help="locate matches with the tokenizer only and parse just their context",
+    action="store_true",
+)
+parser.add_argument(
+    "--normalise-ocr",
+    help="clean up ocr artefacts before parsing, cached per issue in the db",
+    action="store_true",
+)
+parser.add_argument(
+    "--dedup",
+    help="count near-duplicate match windows once per journal, parse them once",
+    action="store_true",
+)
+parser.add_argument(
+    "--build-dtm",
+    help="build document-term matrices from the dump file",
+    action="store_true",
+)
+parser.add_argument(
+    "--use-dtm",
+    help="count terms from stored document-term matrices instead of reparsing",
+    action="store_true",
+)
+parser.add_argument(
+    "--keyness",
+    help="list key terms by log-likelihood from stored document-term matrices",
+    choices=["period", "journal"],
+)
+parser.add_argument(
+    "--correction",
+    help="multiple-testing correction for keyness p-values",
+    choices=CORRECTIONS,
+)
+parser.add_argument(
+    "--memory-budget",
+    help="stream issues and spill matches to disk if the run would need more "
+    "memory than this (e.g. 2G)",
+    type=parse_size,
+)
+parser.add_argument(
+    "--memory-report",
+    help="log peak memory per stage, including python allocations",
+    action="store_true",
+)
+parser.add_argument(
+    "--profile",
+    help="write cpu profiles and log timings of the hot functions",
+    action="store_true",
+)
 
 # logging
 FORMAT = "%(asctime)-15s %(levelname)s %(message)s"
@@ -70,6 +147,11 @@ SEARCH_TEXT = "Anarchis*"
 DATE_FROM = "01.01.1898"
 DATE_TO = "31.12.1898"
 
+# memory budget mode
+STREAM_ROWS = 50  # issues fetched from the db at once
+SPILL_ROWS = 1000  # matches kept in memory before they are written out
+PARSER_CACHE_SIZE = 1000  # parsed texts kept, cleared for every journal
+
 relevant_journals_ids = (
     # 25,  # Agramer Zeitung
     12,  # Arbeiter Zeitung
@@ -110,19 +192,22 @@ relevant_journals_ids = (
 )
 
 
-def get_db_session(echo=False):
-    engine = create_engine(
-        f"sqlite:///{SEARCH_TEXT.replace('*','')}_{DATE_FROM}-{DATE_TO}.db",
-        encoding="utf-8",
-        echo=echo,
-    )
-    Base.metadata.create_all(engine)
-    Session = sessionmaker(bind=engine)
-    return Session()
+def get_stop_words():
+    # spacy's german stop words and our own, without loading a model
+    with open("stop_words.txt", "r") as f:
+        return STOP_WORDS | {word for word in f.read().split("\n")}
 
 
-def dump_relevant_text(search_pattern, dump_file):
-    matcher = Matcher(nlp.vocab)
+def get_light_nlp():
+    # tokenizer and rule based sentencizer only, cheap enough for whole issues
+    light_nlp = spacy.blank("de")
+    light_nlp.add_pipe(light_nlp.create_pipe("sentencizer"))
+    light_nlp.max_length = 10 * nlp.max_length
+    return light_nlp
+
+
+def get_matcher(vocab, search_pattern):
+    matcher = Matcher(vocab)
     # pattern
 
     for search_text in search_pattern:
@@ -134,6 +219,65 @@ def dump_relevant_text(search_pattern, dump_file):
             # {"IS_PUNCT": True},
         ]
         matcher.add(f"{search_text}_pattern".upper(), None, pattern)
+    return matcher
+
+
+def append_match(
+    nlp_dict, issue_id, journal_id, issue_date, match_id, sentence, window
+):
+    logger.debug(f"Match found: '{window}' {issue_date}.")
+    nlp_dict["issue_id"].append(issue_id)
+    nlp_dict["journal_id"].append(journal_id)
+    nlp_dict["issue_date"].append(issue_date)
+    nlp_dict["match_id"].append(match_id)
+    # the text only, a span keeps the doc of the whole issue alive
+    nlp_dict["sentence"].append(sentence.text)
+    nlp_dict["window"].append(window)
+
+
+@timed("nlp")
+def parse_match_contexts(nlp_dict, contexts, batch_size=64):
+    """Run the full pipeline over match contexts and add their parsed sentences.
+
+    Every context is ``(text, match offset in text, match record)``.
+    """
+    records = ((text, (offset, record)) for text, offset, record in contexts)
+    for doc, (offset, record) in nlp.pipe(
+        records, as_tuples=True, batch_size=batch_size
+    ):
+        token = next(t for t in doc if t.idx + len(t) > offset)
+        issue_id, journal_id, issue_date, match_id, window = record
+        append_match(
+            nlp_dict, issue_id, journal_id, issue_date, match_id, token.sent, window
+        )
+
+
+def write_matches(nlp_dict, dump_file, start=0):
+    """Append the matches in *nlp_dict* to *dump_file* and clear them.
+
+    The file is overwritten if *start*, the number of matches written
+    before, is 0. Returns the number of matches written so far.
+    """
+    df = pd.DataFrame(
+        data=nlp_dict, index=range(start, start + len(nlp_dict["issue_id"]))
+    )
+    df.to_csv(dump_file, sep=";", mode="a" if start else "w", header=not start)
+    for values in nlp_dict.values():
+        values.clear()
+    return start + len(df)
+
+
+def dump_relevant_text(
+    search_pattern,
+    dump_file,
+    normalise_ocr=False,
+    two_tier=False,
+    batch_size=64,
+    spill_rows=None,
+):
+    # with two_tier only the match contexts are run through the full pipeline
+    tokenizer_nlp = get_light_nlp() if two_tier else nlp
+    matcher = get_matcher(tokenizer_nlp.vocab, search_pattern)
 
     # get every sentence including the search text
     nlp_dict = {
@@ -145,36 +289,62 @@ def dump_relevant_text(search_pattern, dump_file):
         "window": [],
         # 'subtree': [],
     }
+    contexts = []
+    written = 0
     for (issue_id, journal_id, issue_date, issue_text) in issue_query:
         text = issue_text.decode("utf-8")
-        if len(text) > nlp.max_length:
+        if normalise_ocr:
+            text, _ = get_normalised_text(session, issue_id, text)
+        if len(text) > tokenizer_nlp.max_length:
             logger.warning(
-                f"Skipping issue {issue_id} w/ jounral id: {journal_id}, because text length {len(text)} > {nlp.max_length}."
+                f"Skipping issue {issue_id} w/ jounral id: {journal_id}, because text length {len(text)} > {tokenizer_nlp.max_length}."
             )
             continue
-        doc = nlp(text)  # load text
-        matches = matcher(doc)
+        with span("nlp"):
+            doc = tokenizer_nlp(text)  # load text
+        with span("matcher"):
+            matches = matcher(doc)
         window_length = 100
         for match_id, start, end in matches:
             search_text_token = doc[start]
             sentence = search_text_token.sent
             subtree_list = []
-            start_pos = start - window_length
-            if start < 0:
-                start_pos = 0
-            window_text = doc[start_pos : end + window_length].text
-            logger.debug(f"Match found: '{window_text}' {issue_date}.")
+            start_pos = max(start - window_length, 0)
+            window = doc[start_pos : end + window_length]
             # for token in search_text_token.subtree:
             #     subtree_list.append(token.text)
-            nlp_dict["issue_id"].append(issue_id)
-            nlp_dict["journal_id"].append(journal_id)
-            nlp_dict["issue_date"].append(issue_date)
-            nlp_dict["match_id"].append(match_id)
-            nlp_dict["sentence"].append(sentence)
-            nlp_dict["window"].append(window_text)
+            if two_tier:
+                context_start = min(sentence.start_char, window.start_char)
+                context_end = max(sentence.end_char, window.end_char)
+                contexts.append(
+                    (
+                        text[context_start:context_end],
+                        search_text_token.idx - context_start,
+                        (issue_id, journal_id, issue_date, match_id, window.text),
+                    )
+                )
+            else:
+                append_match(
+                    nlp_dict,
+                    issue_id,
+                    journal_id,
+                    issue_date,
+                    match_id,
+                    sentence,
+                    window.text,
+                )
+        if len(contexts) >= batch_size:
+            parse_match_contexts(nlp_dict, contexts, batch_size)
+            contexts = []
+        if spill_rows and len(nlp_dict["issue_id"]) >= spill_rows:
+            written = write_matches(nlp_dict, dump_file, written)
+    parse_match_contexts(nlp_dict, contexts, batch_size)
+    if normalise_ocr:
+        with span("db commit"):
+            session.commit()
 
-    df = pd.DataFrame(data=nlp_dict)
-    df.to_csv(dump_file)
+    written = write_matches(nlp_dict, dump_file, written)
+    logger.info(f"Dumped {written} matches to: '{dump_file}'")
 
 
 def allow_token(t):
@@ -184,37 +354,33 @@ def allow_token(t):
         return False
     if t.is_punct:
         return False
-    if t.text.lower() in nlp.Defaults.stop_words:
+    if t.text.lower() in stop_words:
         return False
     return True
 
 
 def get_most_common_token_pos(dataframe, token_pos="NOUN", counter_limit=20):
     token_pos_list = []
-    for index, row in dataframe.iterrows():
-        # get noun chunks per sentence
-        doc = nlp(row["sentence"])
+    for parsed in batched_parser.parse(dataframe["sentence"].astype(str).tolist()):
         # noun_list += [nc for nc in doc.noun_chunks]
         token_pos_list += [
             token.text.lower()
-            for token in doc
+            for token in parsed.tokens
             if token.pos_ == token_pos and allow_token(token)
         ]
-    return Counter(token_pos_list).most_common(counter_limit)
+    with span("counter"):
+        return Counter(token_pos_list).most_common(counter_limit)
 
 
 def get_most_common_entities(dataframe, counter_limit=20):
     entity_list = []
-    for index, row in dataframe.iterrows():
-        # get noun chunks per sentence
-        doc = nlp(row["window"])
-        # noun_list += [nc for nc in doc.noun_chunks]
+    windows = dataframe["window"].astype(str).tolist()
+    for parsed in batched_parser.parse(windows, tokens=False):
         entity_list += [
-            ent.text.lower()
-            for ent in [ents for ents in doc.ents]
-            if ent.text.lower() not in nlp.Defaults.stop_words
+            ent.lower() for ent in parsed.ents if ent.lower() not in stop_words
         ]
-    return Counter(entity_list).most_common(counter_limit)
+    with span("counter"):
+        return Counter(entity_list).most_common(counter_limit)
 
 
 def get_most_common_lists(
@@ -246,17 +412,70 @@ def get_most_common_lists(
     )
 
 
-def print_latex_table(journal_word_frequency, word_type, caption, label_prefix):
+def get_dtm_columns(sentence_dtm, window_dtm):
+    return (
+        (sentence_dtm, sentence_dtm.columns("NOUN", stop_words, "anarchis")),
+        (sentence_dtm, sentence_dtm.columns("ADJ", stop_words, "anarchis")),
+        (window_dtm, window_dtm.columns(ENTITY_KIND, stop_words)),
+    )
+
+
+def get_most_common_lists_dtm(
+    sentence_dtm,
+    window_dtm,
+    journal_id,
+    issue_date_start,
+    issue_date_inter,
+    issue_date_stop,
+    counter_limit=20,
+):
+    most_common_lists = []
+    for dtm, columns in get_dtm_columns(sentence_dtm, window_dtm):
+        first_rows = dtm.rows([journal_id], issue_date_start, issue_date_inter)
+        second_rows = dtm.rows([journal_id], issue_date_inter, issue_date_stop)
+        most_common_lists.append(dtm.most_common(first_rows, columns, counter_limit))
+        most_common_lists.append(dtm.most_common(second_rows, columns, counter_limit))
+    return tuple(most_common_lists)
+
+
+def get_keyness_lists_dtm(
+    sentence_dtm,
+    window_dtm,
+    first_filter,
+    second_filter,
+    counter_limit=20,
+    correction=None,
+):
+    keyness_lists = []
+    for dtm, columns in get_dtm_columns(sentence_dtm, window_dtm):
+        keyness = get_keyness(
+            dtm.vocabulary[columns],
+            dtm.term_frequencies(dtm.rows(**first_filter))[columns],
+            dtm.term_frequencies(dtm.rows(**second_filter))[columns],
+            correction,
+        )
+        keyness_lists += get_key_terms(keyness, counter_limit)
+    return tuple(keyness_lists)
+
+
+def print_latex_table(
+    journal_word_frequency,
+    word_type,
+    caption,
+    label_prefix,
+    column_titles=("Vor September", "Ab September"),
+    value_header="Anzahl",
+):
     for journal_title in journal_word_frequency:
         print("\\begin{table}[h!]")
         print("\\centering")
         print("\\begin{tabular}{ | l | l | l | l | }")
         print("\\hline")
         print(
-            "\\multicolumn{2}{|l|}{Vor September} & \\multicolumn{2}{|l|}{Ab September} \\tabularnewline"
+            f"\\multicolumn{{2}}{{|l|}}{{{column_titles[0]}}} & \\multicolumn{{2}}{{|l|}}{{{column_titles[1]}}} \\tabularnewline"
         )
         print("\\hline")
-        print(f"{word_type} & Anzahl & {word_type} & Anzahl\\\\")
+        print(f"{word_type} & {value_header} & {word_type} & {value_header}\\\\")
         print("\\hline")
         rows_1 = []
         rows_2 = []
@@ -296,187 +515,357 @@ if __name__ == "__main__":
     args = parser.parse_args()
     if args.verbose:
         logger.setLevel(10)
-    session = get_db_session(args.verbose)
-
-    # journal stats
-    journal_query = session.query(
-        Journal.journal_id, Journal.title, Journal.language, Journal.publication_place
-    )
-    journal_stats = [(j[0], j[1], j[2], j[3]) for j in journal_query]
-    journals_df = pd.DataFrame(
-        journal_stats,
-        columns=["id", "title", "language", "pub place"],
+    profiler = None
+    if args.profile:
+        profiler = Profiler("statistics")
+        profiler.start()
+    memory_monitor = MemoryMonitor(
+        args.memory_report or args.memory_budget is not None,
+        args.memory_report,
+        args.memory_budget,
     )
-    logger.debug(journals_df.describe(include="all"))
+    try:
+        memory_monitor.stage("issue stats")
+        session = get_db_session(
+            get_corpus_path(SEARCH_TEXT, DATE_FROM, DATE_TO), args.verbose
+        )
 
-    # issue stats
-    issue_query = session.query(
-        Issue.issue_id, Issue.journal_id, Issue.issue_date, Issue.text
-    )
-    issue_stats = [(i[0], i[1], i[2], i[3]) for i in issue_query]
-    issue_df = pd.DataFrame(
-        issue_stats,
-        columns=["id", "journal_id", "date", "text"],
-    )
-    logger.info(issue_df.describe(include="all"))
+        # stored matrices answer --use-dtm and --keyness without a model
+        use_nlp = args.dump_db or args.build_dtm or not (args.use_dtm or args.keyness)
+        low_memory = False
+        if args.memory_budget:
+            footprint = estimate_footprint(
+                *query_text_size(session),
+                get_model_size(args.backend) if use_nlp else 0,
+                CACHE_SIZE if use_nlp else 0,
+            )
+            low_memory = footprint > args.memory_budget
+            logger.info(
+                f"Estimated memory footprint: {format_size(footprint)}, "
+                f"budget: {format_size(args.memory_budget)}."
+            )
+        batch_size = args.batch_size
+        cache_size = CACHE_SIZE
+        if low_memory:
+            batch_size = max(1, args.batch_size // 4)
+            cache_size = PARSER_CACHE_SIZE
+            logger.warning(
+                f"Over memory budget, streaming issues, using nlp batches of "
+                f"{batch_size}, caching {cache_size} parsed texts per journal and "
+                "spilling matches to disk."
+            )
 
-    # nlp stuff
-    nlp = spacy.load("de_core_news_lg")
-    with open("stop_words.txt", "r") as f:
-        nlp.Defaults.stop_words |= {word for word in f.read().split("\n")}
-    dump_file = f"tmp/{SEARCH_TEXT.replace('*', '')}_{DATE_FROM}-{DATE_TO}.csv"
-    search_pattern = [
-        "anarchismus",
-        "anarchist",
-        "anarchistin",
-        "anarchisten",
-        "anarchistinnen",
-    ]
-    if args.dump_db:
-        dump_relevant_text(search_pattern, dump_file)
+        # journal stats
+        journal_query = query_journals(session)
+        journal_stats = [(j[0], j[1], j[2], j[3]) for j in journal_query]
+        journals_df = pd.DataFrame(
+            journal_stats,
+            columns=["id", "title", "language", "pub place"],
+        )
+        logger.debug(journals_df.describe(include="all"))
 
-    # load dataframe from csv
-    df = pd.DataFrame()
-    try:
-        df = pd.read_csv(dump_file, delimiter=";", parse_dates=["issue_date"])
-    except FileNotFoundError:
-        logger.error(f"File: '{dump_file}' not found.")
-
-    issue_date_start = datetime(year=1898, month=1, day=1, hour=0, minute=0, second=0)
-    issue_date_inter = datetime(year=1898, month=9, day=1, hour=0, minute=0, second=0)
-    issue_date_end = datetime(
-        year=1898, month=12, day=31, hour=23, minute=59, second=59
-    )
-    counter_limit = 10
-
-    start_inter_nouns = []
-    inter_end_nouns = []
-    start_inter_adjs = []
-    inter_end_adjs = []
-    start_inter_ents = []
-    inter_end_ents = []
-
-    journal_word_frequency_ents = {}
-    journal_word_frequency_nouns = {}
-    journal_word_frequency_adjs = {}
-    for journal_id in tqdm(relevant_journals_ids):
-        journal_df = df[(df["journal_id"] == journal_id)]
-        journal_title = journals_df[(journals_df["id"] == journal_id)]["title"].values[
-            0
-        ]
-        journal_word_frequency_nouns.update(
-            {
-                str(journal_title): {
-                    "prior": {},
-                    "post": {},
-                }
-            }
+        # issue stats, without the texts in low memory mode
+        issue_query = query_issues(
+            session, yield_per=STREAM_ROWS if low_memory else None
         )
-        journal_word_frequency_adjs.update(
-            {
-                str(journal_title): {
-                    "prior": {},
-                    "post": {},
-                }
-            }
+        if args.duckdb:
+            connection = get_duckdb_connection(
+                get_corpus_path(SEARCH_TEXT, DATE_FROM, DATE_TO, "duckdb")
+            )
+            # summarised by duckdb, the texts never leave the export
+            issue_summary = connection.execute(
+                "SUMMARIZE SELECT issue_id AS id, journal_id, issue_date AS date, "
+                "text_length FROM issues"
+            ).df()
+        else:
+            columns = ["id", "journal_id", "date"]
+            if low_memory:
+                issue_stats = [tuple(i) for i in query_issues(session, text=False)]
+            else:
+                issue_stats = [(i[0], i[1], i[2], i[3]) for i in issue_query]
+                columns.append("text")
+            issue_df = pd.DataFrame(issue_stats, columns=columns)
+            del issue_stats
+            issue_summary = issue_df.describe(include="all")
+        logger.info(issue_summary)
+
+        # nlp stuff
+        stop_words = get_stop_words()
+        if use_nlp:
+            memory_monitor.stage("nlp model")
+            nlp = load_nlp(args.backend)
+            batched_parser = BatchedParser(nlp, batch_size, cache_size)
+        dump_file = f"tmp/{get_corpus_path(SEARCH_TEXT, DATE_FROM, DATE_TO, 'csv')}"
+        search_pattern = [
+            "anarchismus",
+            "anarchist",
+            "anarchistin",
+            "anarchisten",
+            "anarchistinnen",
+        ]
+        dtm_path = f"tmp/dtm/{SEARCH_TEXT.replace('*', '')}_{DATE_FROM}-{DATE_TO}"
+        if args.dump_db:
+            memory_monitor.stage("dump")
+            dump_relevant_text(
+                search_pattern,
+                dump_file,
+                args.normalise_ocr,
+                args.two_tier,
+                batch_size,
+                SPILL_ROWS if low_memory else None,
+            )
+
+        # load dataframe from csv
+        memory_monitor.stage("read dump")
+        df = pd.DataFrame()
+        try:
+            df = pd.read_csv(dump_file, delimiter=";", parse_dates=["issue_date"])
+        except FileNotFoundError:
+            logger.error(f"File: '{dump_file}' not found.")
+
+        if args.dedup and not df.empty:
+            memory_monitor.stage("dedup")
+            df["cluster_id"] = get_duplicate_clusters(
+                df["window"].astype(str).tolist(),
+                df["issue_date"],
+                groups=df["issue_id"].tolist(),
+            )
+            # members take over the texts of their representative, so those are
+            # parsed once and still counted in the journal of every member
+            for column in ("sentence", "window"):
+                df[column] = df[column].values[df["cluster_id"].values]
+            duplicates = df.duplicated(["journal_id", "cluster_id"])
+            logger.info(
+                f"Dropping {duplicates.sum()} near-duplicate matches within journals."
+            )
+            df = df[~duplicates]
+
+        if args.build_dtm:
+            memory_monitor.stage("build dtm")
+            for column in ("sentence", "window"):
+                dtm = build_document_term_matrix(
+                    nlp,
+                    zip(df["issue_id"], df["journal_id"], df["issue_date"], df[column]),
+                    batch_size,
+                )
+                dtm.save(f"{dtm_path}_{column}")
+        if args.use_dtm or args.keyness:
+            sentence_dtm = DocumentTermMatrix.load(f"{dtm_path}_sentence")
+            window_dtm = DocumentTermMatrix.load(f"{dtm_path}_window")
+
+        memory_monitor.stage("analysis")
+        issue_date_start = datetime(
+            year=1898, month=1, day=1, hour=0, minute=0, second=0
         )
-        journal_word_frequency_ents.update(
-            {
-                str(journal_title): {
-                    "prior": {},
-                    "post": {},
-                }
-            }
+        issue_date_inter = datetime(
+            year=1898, month=9, day=1, hour=0, minute=0, second=0
         )
-        (
-            most_common_start_inter_noun,
-            most_common_inter_end_noun,
-            most_common_start_inter_adj,
-            most_common_inter_end_adj,
-            most_common_start_inter_ents,
-            most_common_inter_end_ents,
-        ) = get_most_common_lists(
-            journal_df,
-            issue_date_start,
-            issue_date_inter,
-            issue_date_end,
-            counter_limit,
+        issue_date_end = datetime(
+            year=1898, month=12, day=31, hour=23, minute=59, second=59
         )
-        logger.debug(f"{counter_limit} most common nouns for journal: {journal_title}:")
-        for (word, frequency) in most_common_start_inter_noun:
-            if word not in search_pattern and frequency > 1:
-                start_inter_nouns.append(word)
-                logger.debug(f"{word}: {frequency}")
-                journal_word_frequency_nouns[str(journal_title)]["prior"].update(
-                    {word: frequency}
+        counter_limit = 10
+
+        start_inter_nouns = []
+        inter_end_nouns = []
+        start_inter_adjs = []
+        inter_end_adjs = []
+        start_inter_ents = []
+        inter_end_ents = []
+
+        journal_word_frequency_ents = {}
+        journal_word_frequency_nouns = {}
+        journal_word_frequency_adjs = {}
+        for journal_id in tqdm(relevant_journals_ids):
+            # also free the parsed texts once the sampler saw the budget exceeded
+            if use_nlp and (low_memory or memory_monitor.over_budget):
+                batched_parser.cache.clear()
+            journal_df = df[(df["journal_id"] == journal_id)]
+            journal_title = journals_df[(journals_df["id"] == journal_id)][
+                "title"
+            ].values[0]
+            journal_word_frequency_nouns.update(
+                {
+                    str(journal_title): {
+                        "prior": {},
+                        "post": {},
+                    }
+                }
+            )
+            journal_word_frequency_adjs.update(
+                {
+                    str(journal_title): {
+                        "prior": {},
+                        "post": {},
+                    }
+                }
+            )
+            journal_word_frequency_ents.update(
+                {
+                    str(journal_title): {
+                        "prior": {},
+                        "post": {},
+                    }
+                }
+            )
+            if args.keyness == "period":
+                most_common_lists = get_keyness_lists_dtm(
+                    sentence_dtm,
+                    window_dtm,
+                    {
+                        "journal_ids": [journal_id],
+                        "date_from": issue_date_start,
+                        "date_to": issue_date_inter,
+                    },
+                    {
+                        "journal_ids": [journal_id],
+                        "date_from": issue_date_inter,
+                        "date_to": issue_date_end,
+                    },
+                    counter_limit,
+                    args.correction,
                 )
-        logger.debug(f"{counter_limit} most common nouns for journal: {journal_title}:")
-        for (word, frequency) in most_common_inter_end_noun:
-            if word not in search_pattern and frequency > 1:
-                inter_end_nouns.append(word)
-                logger.debug(f"{word}: {frequency}")
-                journal_word_frequency_nouns[str(journal_title)]["post"].update(
-                    {word: frequency}
+            elif args.keyness == "journal":
+                other_journal_ids = [
+                    j for j in relevant_journals_ids if j != journal_id
+                ]
+                most_common_lists = get_keyness_lists_dtm(
+                    sentence_dtm,
+                    window_dtm,
+                    {"journal_ids": [journal_id]},
+                    {"journal_ids": other_journal_ids},
+                    counter_limit,
+                    args.correction,
                 )
-
-        logger.debug(f"{counter_limit} most common adjs for journal: {journal_title}:")
-        for (word, frequency) in most_common_start_inter_adj:
-            if word not in search_pattern and frequency > 1:
-                start_inter_adjs.append(word)
-                logger.debug(f"{word}: {frequency}")
-                journal_word_frequency_adjs[str(journal_title)]["prior"].update(
-                    {word: frequency}
+            elif args.use_dtm:
+                most_common_lists = get_most_common_lists_dtm(
+                    sentence_dtm,
+                    window_dtm,
+                    journal_id,
+                    issue_date_start,
+                    issue_date_inter,
+                    issue_date_end,
+                    counter_limit,
                 )
-        logger.debug(f"{counter_limit} most common ajds for journal: {journal_title}:")
-        for (word, frequency) in most_common_inter_end_adj:
-            if word not in search_pattern and frequency > 1:
-                inter_end_adjs.append(word)
-                logger.debug(f"{word}: {frequency}")
-                journal_word_frequency_adjs[str(journal_title)]["post"].update(
-                    {word: frequency}
+            else:
+                most_common_lists = get_most_common_lists(
+                    journal_df,
+                    issue_date_start,
+                    issue_date_inter,
+                    issue_date_end,
+                    counter_limit,
                 )
-
-        logger.debug(
-            f"{counter_limit} most common named entities for journal: {journal_title}:"
+            (
+                most_common_start_inter_noun,
+                most_common_inter_end_noun,
+                most_common_start_inter_adj,
+                most_common_inter_end_adj,
+                most_common_start_inter_ents,
+                most_common_inter_end_ents,
+            ) = most_common_lists
+            logger.debug(
+                f"{counter_limit} most common nouns for journal: {journal_title}:"
+            )
+            for (word, frequency) in most_common_start_inter_noun:
+                if word not in search_pattern and frequency > 1:
+                    start_inter_nouns.append(word)
+                    logger.debug(f"{word}: {frequency}")
+                    journal_word_frequency_nouns[str(journal_title)]["prior"].update(
+                        {word: frequency}
+                    )
+            logger.debug(
+                f"{counter_limit} most common nouns for journal: {journal_title}:"
+            )
+            for (word, frequency) in most_common_inter_end_noun:
+                if word not in search_pattern and frequency > 1:
+                    inter_end_nouns.append(word)
+                    logger.debug(f"{word}: {frequency}")
+                    journal_word_frequency_nouns[str(journal_title)]["post"].update(
+                        {word: frequency}
+                    )
+
+            logger.debug(
+                f"{counter_limit} most common adjs for journal: {journal_title}:"
+            )
+            for (word, frequency) in most_common_start_inter_adj:
+                if word not in search_pattern and frequency > 1:
+                    start_inter_adjs.append(word)
+                    logger.debug(f"{word}: {frequency}")
+                    journal_word_frequency_adjs[str(journal_title)]["prior"].update(
+                        {word: frequency}
+                    )
+            logger.debug(
+                f"{counter_limit} most common ajds for journal: {journal_title}:"
+            )
+            for (word, frequency) in most_common_inter_end_adj:
+                if word not in search_pattern and frequency > 1:
+                    inter_end_adjs.append(word)
+                    logger.debug(f"{word}: {frequency}")
+                    journal_word_frequency_adjs[str(journal_title)]["post"].update(
+                        {word: frequency}
+                    )
+
+            logger.debug(
+                f"{counter_limit} most common named entities for journal: {journal_title}:"
+            )
+            for (word, frequency) in most_common_start_inter_ents:
+                if word not in search_pattern and frequency > 1:
+                    start_inter_ents.append(word)
+                    logger.debug(f"{word}: {frequency}")
+                    journal_word_frequency_ents[str(journal_title)]["prior"].update(
+                        {word: frequency}
+                    )
+
+            logger.debug(
+                f"{counter_limit} most common named entities for journal: {journal_title}:"
+            )
+            for (word, frequency) in most_common_inter_end_ents:
+                if word not in search_pattern and frequency > 1:
+                    inter_end_ents.append(word)
+                    logger.debug(f"{word}: {frequency}")
+                    journal_word_frequency_ents[str(journal_title)]["post"].update(
+                        {word: frequency}
+                    )
+
+        table_options = {}
+        if args.keyness == "period":
+            table_options = {"value_header": "LL"}
+        elif args.keyness == "journal":
+            table_options = {
+                "column_titles": ("Zeitung", "Andere Zeitungen"),
+                "value_header": "LL",
+            }
+        logger.info("Printing entity frequencies per journal")
+        print_latex_table(
+            journal_word_frequency_ents,
+            "Entität",
+            "Entitäten im Suchintervall",
+            "ent_window",
+            **table_options,
         )
-        for (word, frequency) in most_common_start_inter_ents:
-            if word not in search_pattern and frequency > 1:
-                start_inter_ents.append(word)
-                logger.debug(f"{word}: {frequency}")
-                journal_word_frequency_ents[str(journal_title)]["prior"].update(
-                    {word: frequency}
-                )
-
-        logger.debug(
-            f"{counter_limit} most common named entities for journal: {journal_title}:"
+        logger.info("Printing noun frequencies per journal")
+        print_latex_table(
+            journal_word_frequency_nouns,
+            "Nomen",
+            "Nomen im Suchsatz",
+            "noun_sent",
+            **table_options,
         )
-        for (word, frequency) in most_common_inter_end_ents:
-            if word not in search_pattern and frequency > 1:
-                inter_end_ents.append(word)
-                logger.debug(f"{word}: {frequency}")
-                journal_word_frequency_ents[str(journal_title)]["post"].update(
-                    {word: frequency}
-                )
-
-    logger.info("Printing entity frequencies per journal")
-    print_latex_table(
-        journal_word_frequency_ents,
-        "Entität",
-        "Entitäten im Suchintervall",
-        "ent_window",
-    )
-    logger.info("Printing noun frequencies per journal")
-    print_latex_table(
-        journal_word_frequency_nouns, "Nomen", "Nomen im Suchsatz", "noun_sent"
-    )
-    logger.info("Printing adj frequencies per journal")
-    print_latex_table(
-        journal_word_frequency_adjs, "Adjektiv", "Adjektive im Suchsatz", "adj_sent"
-    )
-    # logger.info(f"most common prior words: {sorted(set(start_inter_words))}")
-    # logger.info(f"most common post words: {sorted(set(inter_end_words))}")
-    # logger.info(f"most common prior entities: {sorted(set(start_inter_ents))}")
-    # logger.info(f"most common post entities: {sorted(set(inter_end_ents))}")
-
-    session.close()
+        logger.info("Printing adj frequencies per journal")
+        print_latex_table(
+            journal_word_frequency_adjs,
+            "Adjektiv",
+            "Adjektive im Suchsatz",
+            "adj_sent",
+            **table_options,
+        )
+        # logger.info(f"most common prior words: {sorted(set(start_inter_words))}")
+        # logger.info(f"most common post words: {sorted(set(inter_end_words))}")
+        # logger.info(f"most common prior entities: {sorted(set(start_inter_ents))}")
+        # logger.info(f"most common post entities: {sorted(set(inter_end_ents))}")
+
+        session.close()
+    finally:
+        memory_monitor.stop()
+        if profiler:
+            profiler.stop()
     logger.info(f"Completed. Processing took {(datetime.now() - t1).seconds}s.")
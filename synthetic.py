@@ -0,0 +1,162 @@
+# anarchism and gender
+# synthetic.py
+
+# standard imports
+import random
+from datetime import datetime, timedelta
+
+JOURNALS = (
+    ("Arbeiter Zeitung", "aze"),
+    ("Das Vaterland", "vtl"),
+    ("Deutsches Volksblatt", "dvb"),
+    ("Neue Freie Presse", "nfp"),
+    ("Pester Lloyd", "pel"),
+    ("Prager Tagblatt", "ptb"),
+)
+
+SEARCH_TERMS = (
+    "Anarchismus",
+    "Anarchist",
+    "Anarchisten",
+    "Anarchistin",
+    "Anarchistinnen",
+)
+
+FUNCTION_WORDS = (
+    "der die das den dem des ein eine einen einem und oder aber nicht auch "
+    "in im auf an aus bei mit nach von vor zu zur zum über unter für gegen "
+    "ist sind war waren wird wurde wurden hat haben hatte sich er sie es wir "
+    "welche welcher dieser diese noch schon nur so wie als wenn daß dass"
+).split()
+
+NOUNS = (
+    "Regierung Polizei Kaiserin Kaiser Attentat Mörder Verhaftung Gericht "
+    "Arbeiter Versammlung Zeitung Minister Stadt Wien Genf Paris Rom Frau "
+    "Mann Partei Socialdemokraten Bürger Staat Gesetz Bombe Urtheil Proceß "
+    "Nachricht Telegramm Bericht Frage Volk Reichsrath Abgeordnete Jahre"
+).split()
+
+ADJECTIVES = (
+    "große neue alte österreichische ungarische französische italienische "
+    "gestrige heutige politische schwere furchtbare bekannte öffentliche"
+).split()
+
+# typical ANNO OCR confusions
+OCR_CONFUSIONS = {"s": "ſ", "e": "c", "n": "u", "i": "l", "ü": "ii", "h": "b"}
+
+
+def get_word(rng, term_rate):
+    if rng.random() < term_rate:
+        return rng.choice(SEARCH_TERMS)
+    roll = rng.random()
+    if roll < 0.55:
+        return rng.choice(FUNCTION_WORDS)
+    if roll < 0.85:
+        return rng.choice(NOUNS)
+    if roll < 0.95:
+        return rng.choice(ADJECTIVES)
+    return str(rng.randint(1, 1898))
+
+
+def add_ocr_noise(word, rng, noise_rate):
+    if rng.random() >= noise_rate:
+        return word
+    position = rng.randrange(len(word))
+    character = word[position]
+    return (
+        word[:position]
+        + OCR_CONFUSIONS.get(character, character)
+        + word[position + 1 :]
+    )
+
+
+def generate_page_text(rng, words, term_rate=0.002, noise_rate=0.02, line_length=60):
+    """German newspaper style OCR text with hyphenated line breaks."""
+    lines = []
+    line = ""
+    sentence_length = 0
+    for i in range(words):
+        word = add_ocr_noise(get_word(rng, term_rate), rng, noise_rate)
+        if sentence_length == 0:
+            word = word[:1].upper() + word[1:]
+        sentence_length += 1
+        if sentence_length > rng.randint(6, 25):
+            word += rng.choice(".,.;:")
+            if word[-1] in ".:":
+                sentence_length = 0
+        if len(line) + len(word) + 1 > line_length:
+            split = rng.randint(2, len(word) - 1) if len(word) > 5 else 0
+            if split and rng.random() < 0.3:
+                lines.append(f"{line} {word[:split]}-".strip())
+                line = word[split:]
+                continue
+            lines.append(line)
+            line = word
+        else:
+            line = f"{line} {word}".strip()
+    lines.append(line)
+    return "\n".join(lines)
+
+
+def generate_issue_text(
+    rng, journal_title, issue_date, pages, words_per_page, term_rate, noise_rate
+):
+    """ANNO full text of one issue, pages separated by "[ title - date - Seite N ]"."""
+    date = datetime.strftime(issue_date, "%Y%m%d")
+    return "\n".join(
+        f"[ {journal_title} - {date} - Seite {page} ]\n"
+        + generate_page_text(rng, words_per_page, term_rate, noise_rate)
+        for page in range(1, pages + 1)
+    ).encode("utf-8")
+
+
+def generate_corpus(
+    issues=100,
+    pages=8,
+    words_per_page=1500,
+    term_rate=0.002,
+    noise_rate=0.02,
+    date_from=datetime(1898, 1, 1),
+    days=365,
+    seed=1898,
+):
+    """Generate *issues* synthetic ANNO issues spread over *days* from *date_from*.
+
+    Every issue is a dict with the journal title and abbreviation, the issue
+    date, url and full text and one url and hit flag per page, i.e. what
+    crawl.py extracts from ANNO.
+    """
+    rng = random.Random(seed)
+    corpus = []
+    for i in range(issues):
+        journal_title, journal_abbr = rng.choice(JOURNALS)
+        issue_date = date_from + timedelta(days=rng.randrange(days))
+        issue_code = f"{journal_abbr}{datetime.strftime(issue_date, '%Y%m%d')}"
+        journal_url = f"https://anno.onb.ac.at/cgi-content/anno?aid={journal_abbr}"
+        text = generate_issue_text(
+            rng,
+            journal_title,
+            issue_date,
+            pages,
+            words_per_page,
+            term_rate,
+            noise_rate,
+        )
+        corpus.append(
+            {
+                "journal_title": journal_title,
+                "journal_abbr": journal_abbr,
+                "journal_url": journal_url,
+                "issue_date": issue_date,
+                "url": f"http://data.onb.ac.at/ANNO/{issue_code}-{i}",
+                "text": text,
+                "pages": [
+                    (
+                        f"{journal_url}&datum={issue_code[3:]}&seite={page}&id={i}",
+                        rng.random() < 0.2,
+                    )
+                    for page in range(1, pages + 1)
+                ],
+            }
+        )
+    return corpus
@@ -0,0 +1,249 @@
+# anarchism and gender
+# timeseries.py
+
+# standard imports
+import hashlib
+from datetime import datetime
+import json
+import logging
+import os
+
+# data
+import numpy as np
+import pandas as pd
+
+# db
+from sqlalchemy import func
+
+# project specific
+from columnar import get_export_version
+from db import Issue, Page
+from profiling import timed
+
+logger = logging.getLogger("anarchism")
+
+CACHE_DIR = "tmp/cache/timeseries"
+
+# sqlite strftime formats, python's strftime understands the same ones
+GRANULARITIES = {
+    "day": "%Y-%m-%d",
+    "week": "%Y-%W",
+    "month": "%Y-%m",
+    "year": "%Y",
+}
+UNITS = ("issues", "pages", "hits", "matches")
+
+MONTH_NAMES = (
+    "Jänner",
+    "Februar",
+    "März",
+    "April",
+    "Mai",
+    "Juni",
+    "Juli",
+    "August",
+    "September",
+    "Oktober",
+    "November",
+    "Dezember",
+)
+
+
+def get_file_version(path):
+    """Modification time and size of *path*, None if it doesn't exist."""
+    if not os.path.exists(path):
+        return None
+    stat = os.stat(path)
+    return f"{stat.st_mtime_ns}-{stat.st_size}"
+
+
+def get_db_version(session):
+    """Count and highest id of issues and pages.
+
+    The db file can't be used, every connection in WAL mode touches it.
+    Crawling only adds rows, so the ids change whenever the counts can.
+    """
+    issues = session.query(func.count(Issue.issue_id), func.max(Issue.issue_id))
+    pages = session.query(func.count(Page.page_id), func.max(Page.page_id))
+    return "-".join(str(value) for value in issues.one() + pages.one())
+
+
+def query_time_series(
+    session,
+    unit="issues",
+    granularity="month",
+    journal_ids=None,
+    date_from=None,
+    date_to=None,
+):
+    """Count issues, pages or hit pages per journal and period in SQL."""
+    period = func.strftime(GRANULARITIES[granularity], Issue.issue_date)
+    if unit == "issues":
+        count = func.count(Issue.issue_id)
+    else:
+        count = func.count(Page.page_id)
+    query = session.query(Issue.journal_id, period, count)
+    if unit in ("pages", "hits"):
+        query = query.join(Page, Page.issue_id == Issue.issue_id)
+    if unit == "hits":
+        query = query.filter(Page.hit.is_(True))
+    if journal_ids:
+        query = query.filter(Issue.journal_id.in_(journal_ids))
+    if date_from is not None:
+        query = query.filter(Issue.issue_date >= date_from)
+    if date_to is not None:
+        query = query.filter(Issue.issue_date < date_to)
+    query = query.group_by(Issue.journal_id, period)
+    return pd.DataFrame(query.all(), columns=["journal_id", "period", "count"])
+
+
+def query_time_series_duckdb(
+    connection,
+    unit="issues",
+    granularity="month",
+    journal_ids=None,
+    date_from=None,
+    date_to=None,
+):
+    """Count issues, pages or hit pages per journal and period in DuckDB."""
+    conditions = []
+    params = [GRANULARITIES[granularity]]
+    if unit == "hits":
+        conditions.append("hit")
+    if journal_ids:
+        conditions.append(f"journal_id IN ({', '.join('?' for _ in journal_ids)})")
+        params += list(journal_ids)
+    if date_from is not None:
+        conditions.append("issue_date >= ?")
+        params.append(date_from)
+    if date_to is not None:
+        conditions.append("issue_date < ?")
+        params.append(date_to)
+    sql = (
+        "SELECT journal_id, strftime(issue_date, ?) AS period, count(*) AS count "
+        f"FROM {'issues' if unit == 'issues' else 'pages'}"
+    )
+    if conditions:
+        sql += f" WHERE {' AND '.join(conditions)}"
+    sql += " GROUP BY journal_id, period ORDER BY journal_id, period"
+    return connection.execute(sql, params).df()
+
+
+def count_matches(
+    index, term, granularity="month", journal_ids=None, date_from=None, date_to=None
+):
+    """Count the tokens matching *term* per journal and period in a TokenIndex."""
+    hits = index.get_hits(term)
+    issues = np.searchsorted(index.issue_indptr, hits, side="right") - 1
+    matches = pd.DataFrame(
+        {
+            "journal_id": index.journal_ids[issues],
+            "issue_date": index.issue_dates[issues],
+        }
+    )
+    if journal_ids:
+        matches = matches[matches["journal_id"].isin(journal_ids)]
+    if date_from is not None:
+        matches = matches[matches["issue_date"] >= date_from]
+    if date_to is not None:
+        matches = matches[matches["issue_date"] < date_to]
+    matches = matches.assign(
+        period=matches["issue_date"].dt.strftime(GRANULARITIES[granularity])
+    )
+    return matches.groupby(["journal_id", "period"]).size().reset_index(name="count")
+
+
+@timed()
+def get_time_series(
+    session,
+    unit="issues",
+    granularity="month",
+    journal_ids=None,
+    date_from=None,
+    date_to=None,
+    term=None,
+    index=None,
+    connection=None,
+    cache_dir=CACHE_DIR,
+):
+    """Counts per journal and period as a DataFrame (journal_id, period, count).
+
+    ``matches`` counts the tokens matching *term* in the TokenIndex *index*,
+    all other units are aggregated by the db, or by the DuckDB *connection*
+    to a Parquet export if given. Results are cached in *cache_dir*, keyed
+    by the query and the version of the db, export or index.
+    """
+    if unit == "matches":
+        version = get_file_version(os.path.join(index.path, "token_ids.npy"))
+    elif connection is not None:
+        version = f"duckdb-{get_export_version(connection)}"
+    else:
+        version = get_db_version(session)
+    key = json.dumps(
+        [
+            unit,
+            granularity,
+            sorted(journal_ids or []),
+            str(date_from),
+            str(date_to),
+            term,
+            version,
+        ]
+    )
+    cache_file = os.path.join(
+        cache_dir, f"{hashlib.sha1(key.encode('utf-8')).hexdigest()}.csv"
+    )
+    if version and os.path.exists(cache_file):
+        logger.debug(f"Using cached time series: '{cache_file}'")
+        return pd.read_csv(cache_file, dtype={"period": str})
+
+    if unit == "matches":
+        series = count_matches(
+            index, term, granularity, journal_ids, date_from, date_to
+        )
+    elif connection is not None:
+        series = query_time_series_duckdb(
+            connection, unit, granularity, journal_ids, date_from, date_to
+        )
+    else:
+        series = query_time_series(
+            session, unit, granularity, journal_ids, date_from, date_to
+        )
+    if version:
+        os.makedirs(cache_dir, exist_ok=True)
+        series.to_csv(cache_file, index=False)
+    logger.debug(f"Aggregated {len(series)} {unit} counts by {granularity}.")
+    return series
+
+
+def get_period_start(period, granularity):
+    """First day of a period key, clipped to the year for weeks."""
+    year = int(period[:4])
+    if granularity == "week":
+        # week 00 holds the days before the first monday of the year
+        start = datetime.strptime(f"{period}-1", "%Y-%W-%w")
+        return max(start, datetime(year, 1, 1))
+    if granularity == "year":
+        return datetime(year, 1, 1)
+    return datetime.strptime(period, GRANULARITIES[granularity])
+
+
+def get_periods(granularity, first_day, last_day):
+    """Keys of all periods from *first_day* through *last_day*, in order."""
+    days = pd.date_range(first_day, last_day, freq="D")
+    return list(dict.fromkeys(days.strftime(GRANULARITIES[granularity])))
+
+
+def get_period_label(period, granularity, with_year=True):
+    """German axis label of a period key, e.g. "1898-01" becomes "Jänner 1898"."""
+    if granularity == "month":
+        year, month = period.split("-")
+        label = MONTH_NAMES[int(month) - 1]
+        return f"{label} {year}" if with_year else label
+    if granularity == "week":
+        year, week = period.split("-")
+        return f"KW {int(week)} {year}" if with_year else f"KW {int(week)}"
+    if granularity == "day":
+        year, month, day = period.split("-")
+        return f"{day}.{month}.{year}" if with_year else f"{day}.{month}."
+    return period
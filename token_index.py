@@ -0,0 +1,178 @@
+# anarchism and gender
+# token_index.py
+
+# standard imports
+import logging
+import os
+import re
+
+# data
+import numpy as np
+import pandas as pd
+
+# project specific
+from db import query_issues, query_journals
+from ocr import get_normalised_text
+
+logger = logging.getLogger("anarchism")
+
+INDEX_ARRAYS = (
+    "token_starts",
+    "token_ends",
+    "token_ids",
+    "postings",
+    "postings_indptr",
+    "issue_indptr",
+    "issue_ids",
+    "journal_ids",
+    "issue_dates",
+)
+
+token_pattern = re.compile(r"\w+|[^\w\s]")
+
+
+def get_byte_offsets(text):
+    """Byte offset of every character of *text* (plus its end) in UTF-8."""
+    code_points = np.frombuffer(text.encode("utf-32-le"), dtype=np.uint32)
+    widths = (
+        1 + (code_points >= 0x80) + (code_points >= 0x800) + (code_points >= 0x10000)
+    )
+    return np.concatenate(([0], np.cumsum(widths)))
+
+
+class TokenIndex:
+    """Token offsets and postings of every issue, stored next to the corpus db.
+
+    All issue texts are concatenated into one UTF-8 file which is
+    memory-mapped together with the offset arrays, so looking up a term and
+    cutting out its context never touches the db or spaCy.
+    """
+
+    def __init__(self, path, arrays, vocabulary, journal_titles, text):
+        self.path = path
+        self.vocabulary = vocabulary
+        # term ids in alphabetical order of their terms, for binary search
+        self.term_order = np.argsort(vocabulary, kind="stable")
+        self.sorted_vocabulary = vocabulary[self.term_order]
+        self.journal_titles = journal_titles
+        self.text = text
+        for name in INDEX_ARRAYS:
+            setattr(self, name, arrays[name])
+
+    def __repr__(self):
+        return (
+            f"<TokenIndex {len(self.issue_ids)} issues, {len(self.token_ids)} tokens>"
+        )
+
+    @classmethod
+    def load(cls, path):
+        arrays = {
+            name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r")
+            for name in INDEX_ARRAYS
+        }
+        with open(os.path.join(path, "vocabulary.txt"), "r") as f:
+            # object array, a fixed width one would be as wide as the longest
+            # ocr junk token
+            vocabulary = np.array(f.read().split("\n"), dtype=object)
+        journal_titles = pd.read_csv(
+            os.path.join(path, "journals.tsv"), sep="\t", index_col="journal_id"
+        )["title"]
+        text = np.memmap(os.path.join(path, "text.bin"), dtype=np.uint8, mode="r")
+        return cls(path, arrays, vocabulary, journal_titles, text)
+
+    def get_term_ids(self, term):
+        """Ids of *term*, or of all terms starting with it if it ends with *."""
+        term = term.lower()
+        if term.endswith("*"):
+            first, last = term[:-1], term[:-1] + "\U0010ffff"
+        else:
+            first, last = term, term
+        start = np.searchsorted(self.sorted_vocabulary, first, side="left")
+        end = np.searchsorted(self.sorted_vocabulary, last, side="right")
+        return np.sort(self.term_order[start:end])
+
+    def get_hits(self, term):
+        """Positions of all tokens matching *term*, in corpus order."""
+        term_ids = self.get_term_ids(term)
+        hits = [
+            self.postings[self.postings_indptr[i] : self.postings_indptr[i + 1]]
+            for i in term_ids
+        ]
+        return np.sort(np.concatenate(hits)) if hits else np.array([], dtype=np.int64)
+
+    def get_text(self, first_token, last_token):
+        """Text from the start of *first_token* to the end of *last_token*."""
+        if last_token < first_token:
+            return ""
+        data = self.text[self.token_starts[first_token] : self.token_ends[last_token]]
+        return " ".join(data.tobytes().decode("utf-8").split())
+
+
+def build_token_index(session, path, normalise_ocr=False):
+    os.makedirs(path, exist_ok=True)
+    term_ids = {}
+    token_starts = []
+    token_ends = []
+    token_ids = []
+    issue_indptr = [0]
+    issue_ids = []
+    journal_ids = []
+    issue_dates = []
+    byte_position = 0
+    issue_query = query_issues(session)
+    with open(os.path.join(path, "text.bin"), "wb") as f:
+        for issue_id, journal_id, issue_date, issue_text in issue_query:
+            text = issue_text.decode("utf-8")
+            if normalise_ocr:
+                text, _ = get_normalised_text(session, issue_id, text)
+            matches = list(token_pattern.finditer(text))
+            byte_offsets = get_byte_offsets(text) + byte_position
+            char_starts = np.array([m.start() for m in matches], dtype=np.int64)
+            char_ends = np.array([m.end() for m in matches], dtype=np.int64)
+            token_starts.append(byte_offsets[char_starts])
+            token_ends.append(byte_offsets[char_ends])
+            token_ids.append(
+                np.array(
+                    [
+                        term_ids.setdefault(m.group().lower(), len(term_ids))
+                        for m in matches
+                    ],
+                    dtype=np.int32,
+                )
+            )
+            issue_indptr.append(issue_indptr[-1] + len(matches))
+            issue_ids.append(issue_id)
+            journal_ids.append(journal_id)
+            issue_dates.append(np.datetime64(issue_date, "D"))
+            data = text.encode("utf-8")
+            f.write(data)
+            byte_position += len(data)
+    if normalise_ocr:
+        session.commit()
+
+    token_ids = np.concatenate(token_ids) if token_ids else np.array([], np.int32)
+    postings = np.argsort(token_ids, kind="stable")
+    postings_indptr = np.searchsorted(token_ids[postings], np.arange(len(term_ids) + 1))
+    arrays = {
+        "token_starts": np.concatenate(token_starts) if token_starts else [],
+        "token_ends": np.concatenate(token_ends) if token_ends else [],
+        "token_ids": token_ids,
+        "postings": postings,
+        "postings_indptr": postings_indptr,
+        "issue_indptr": np.array(issue_indptr, dtype=np.int64),
+        "issue_ids": np.array(issue_ids, dtype=np.int64),
+        "journal_ids": np.array(journal_ids, dtype=np.int64),
+        "issue_dates": np.array(issue_dates, dtype="datetime64[D]"),
+    }
+    for name in INDEX_ARRAYS:
+        np.save(os.path.join(path, f"{name}.npy"), np.asarray(arrays[name]))
+    vocabulary = sorted(term_ids, key=term_ids.get)
+    with open(os.path.join(path, "vocabulary.txt"), "w") as f:
+        f.write("\n".join(vocabulary))
+    pd.DataFrame(
+        [(j[0], j[1]) for j in query_journals(session)],
+        columns=["journal_id", "title"],
+    ).to_csv(os.path.join(path, "journals.tsv"), sep="\t", index=False)
+    logger.info(
+        f"Indexed {len(token_ids)} tokens of {len(issue_ids)} issues to: '{path}'"
+    )